@@ -0,0 +1,181 @@
+"""
+Apply the merge output to many databases headlessly, e.g. all the kernelcaches of a release.
+
+classes.json and prototypes.json are loaded and indexed once and shared with the worker processes. Each database
+(or binary, which is analyzed first) is opened, renamed with ida_renamer, saved, and summarized.
+
+The database layer is a `DatabaseBackend` (idalib by default) and the renaming a `Renamer`, so the driver runs
+without IDA given stand-ins for both.
+"""
+
+import argparse
+import json
+import multiprocessing
+import sys
+import time
+import traceback
+from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+from idb_cache import DatabaseBackend
+from merge_vtable_and_classes import CLASSES_OUTPUT, PROTOTYPES_OUTPUT
+from renamer_data import Clazz, Prototype, parse_classes
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+DATABASE_SUFFIXES = (".i64", ".idb")
+
+
+@dataclass
+class RenameIndex:
+    """The merge output, as loaded by ida_renamer"""
+
+    prototypes: list[Prototype]
+    classes: dict[str, Clazz]
+
+
+@dataclass
+class DatabaseSummary:
+    path: str
+    status: str
+    classes_renamed: int = 0
+    slots_retyped: int = 0
+    errors: int = 0
+    duration: float = 0.0
+    error: str | None = None
+
+
+# Renames the open database, returning (classes renamed, slots retyped, errors)
+type Renamer = Callable[[RenameIndex, bool], tuple[int, int, int]]
+
+
+def load_index(classes_file: Path, prototypes_file: Path) -> RenameIndex:
+    with prototypes_file.open() as f:
+        prototypes = json.load(f)
+    with classes_file.open() as f:
+        classes = {cls["name"]: cls for cls in parse_classes(json.load(f))}
+    return RenameIndex(prototypes, classes)
+
+
+def ida_backend() -> DatabaseBackend:
+    from kdk_mass_extract_vtable import IdaBackend
+
+    return IdaBackend()
+
+
+def ida_rename(index: RenameIndex, force_apply: bool) -> tuple[int, int, int]:
+    # IDA is only available in the workers
+    from ida_renamer import rename_classes
+
+    stats = rename_classes(index.prototypes, index.classes, False, False, force_apply)
+    return stats.classes_renamed, stats.slots_retyped, stats.errors
+
+
+def rename_database(
+    path: Path, index: RenameIndex, backend: DatabaseBackend, renamer: Renamer, force_apply: bool = False
+) -> DatabaseSummary:
+    """
+    Open the database, rename it and save it. Failures are reported in the summary instead of raised, and a database
+    whose renaming failed is closed without saving.
+    """
+    start = time.monotonic()
+    try:
+        # A database is already analyzed, a binary is not
+        backend.open(path, path.suffix not in DATABASE_SUFFIXES)
+        try:
+            classes_renamed, slots_retyped, errors = renamer(index, force_apply)
+        except BaseException:
+            # Do not persist a half renamed database
+            backend.close(False)
+            raise
+        backend.close(True)
+    except Exception as e:
+        traceback.print_exc()
+        return DatabaseSummary(str(path), STATUS_FAILED, duration=time.monotonic() - start, error=repr(e))
+    return DatabaseSummary(
+        str(path), STATUS_OK, classes_renamed, slots_retyped, errors, duration=time.monotonic() - start
+    )
+
+
+# region worker process
+_worker_state: tuple[RenameIndex, DatabaseBackend, Renamer, bool] | None = None
+
+
+def _init_worker(index: RenameIndex, backend_factory: Callable[[], DatabaseBackend], renamer: Renamer, force: bool):
+    global _worker_state
+    _worker_state = (index, backend_factory(), renamer, force)
+
+
+def _rename_in_worker(path: Path) -> DatabaseSummary:
+    assert _worker_state is not None
+    index, backend, renamer, force_apply = _worker_state
+    return rename_database(path, index, backend, renamer, force_apply)
+
+
+# endregion
+
+
+def rename_databases(
+    paths: list[Path],
+    index: RenameIndex,
+    jobs: int = 1,
+    backend_factory: Callable[[], DatabaseBackend] = ida_backend,
+    renamer: Renamer = ida_rename,
+    force_apply: bool = False,
+) -> list[DatabaseSummary]:
+    """Rename each database in one of `jobs` worker processes. Summaries are in the order of the paths."""
+    # idalib is not fork safe
+    with ProcessPoolExecutor(
+        max_workers=jobs,
+        mp_context=multiprocessing.get_context("spawn"),
+        initializer=_init_worker,
+        initargs=(index, backend_factory, renamer, force_apply),
+    ) as executor:
+        futures = {executor.submit(_rename_in_worker, path): path for path in paths}
+        summaries: dict[Path, DatabaseSummary] = {}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                summary = future.result()
+            except Exception as e:
+                # The worker died, e.g. IDA crashed
+                summary = DatabaseSummary(str(path), STATUS_FAILED, error=repr(e))
+            summaries[path] = summary
+            _print_summary(summary)
+    return [summaries[path] for path in paths]
+
+
+def _print_summary(summary: DatabaseSummary):
+    if summary.status == STATUS_OK:
+        print(
+            f"[Info] {Path(summary.path).name}: {summary.classes_renamed} classes renamed, "
+            f"{summary.slots_retyped} slots retyped, {summary.errors} errors in {summary.duration:.0f}s"
+        )
+    else:
+        print(f"[Error] {Path(summary.path).name}: {summary.error}")
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="batch_renamer.py")
+    parser.add_argument("databases", nargs="+", type=Path, help="databases or binaries to rename")
+    parser.add_argument("--classes", type=Path, default=CLASSES_OUTPUT, help="classes.json of the merge")
+    parser.add_argument("--prototypes", type=Path, default=PROTOTYPES_OUTPUT, help="prototypes.json of the merge")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of databases renamed in parallel")
+    parser.add_argument("--force-apply", action="store_true", help="retype methods even if they already have a type")
+    parser.add_argument("--summary", type=Path, help="write the per-database summary to this JSON file")
+    options = parser.parse_args(args)
+
+    index = load_index(options.classes, options.prototypes)
+    summaries = rename_databases(options.databases, index, options.jobs, force_apply=options.force_apply)
+
+    failed = sum(summary.status != STATUS_OK for summary in summaries)
+    print(f"[Info] Renamed {len(summaries) - failed}/{len(summaries)} databases")
+    if options.summary:
+        with options.summary.open("w") as f:
+            json.dump([asdict(summary) for summary in summaries], f, indent=4)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
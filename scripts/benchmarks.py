@@ -0,0 +1,547 @@
+"""
+Benchmarks for the offline tooling around the merge step.
+
+Each benchmark runs either on real data - the merge output (default: ../src/classes.json, ../src/prototypes.json)
+or its input - or on a synthetic class hierarchy generated with --synthetic <number of classes>.
+
+Usage: benchmarks.py <benchmark> [--synthetic N] [classes.json prototypes.json]
+       benchmarks.py ingest|incremental|symbols|delta [--synthetic N] [classes.json methods_folder]
+       benchmarks.py stream|archive [--synthetic N]
+"""
+
+import argparse
+import contextlib
+import gzip
+import io
+import json
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections.abc import Callable
+from functools import partial
+from pathlib import Path
+
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    EnhancedJSONEncoder,
+    InputMethod,
+    MethodPrototype,
+    merge_vtables,
+    read_merged_output,
+    write_json_atomic,
+)
+
+PURE_VIRTUAL_NAME = "__cxa_pure_virtual"
+
+
+# region synthetic data
+def _mangle(class_name: str, method_name: str) -> str:
+    return f"__ZN{len(class_name)}{class_name}{len(method_name)}{method_name}Ev"
+
+
+def _method(class_name: str, name: str, index: int, is_pure_virtual: bool, is_implemented: bool) -> dict:
+    """A method in the format of kdk_extract_vtable output"""
+    if is_pure_virtual:
+        return {
+            "name": PURE_VIRTUAL_NAME,
+            "mangled_name": "_" + PURE_VIRTUAL_NAME,
+            "return_type": "???",
+            "parameters": [{"type": "???", "name": None}],
+            "is_pure_virtual": True,
+            "is_implemented_by_current_class": False,
+            "vtable_index": index,
+        }
+    return {
+        "name": name,
+        "mangled_name": _mangle(class_name, name),
+        "return_type": "IOReturn",
+        "parameters": [{"type": "unsigned int", "name": "arg0"}, {"type": "void *", "name": None}],
+        "is_pure_virtual": False,
+        "is_implemented_by_current_class": is_implemented,
+        "vtable_index": index,
+    }
+
+
+def synthetic_dataset(num_classes: int, seed: int = 0) -> tuple[list[dict], dict[str, list[dict]]]:
+    """
+    Generate a class hierarchy rooted at OSObject, in the format of collect_classes (classes)
+    and kdk_extract_vtable (class name -> methods).
+    """
+    rng = random.Random(seed)  # noqa: S311
+    classes = [{"name": "OSObject", "parent": None, "is_abstract": False}]
+    names = {"OSObject": ["~OSObject"] + [f"osobject{i}" for i in range(1, 60)]}
+    vtables = {"OSObject": [_method("OSObject", name, i, False, True) for i, name in enumerate(names["OSObject"])]}
+
+    for i in range(1, num_classes):
+        # Prefer recent classes as parents to get deep chains as well as wide fan-out
+        parent = classes[rng.randrange(max(0, i - 50), i)]["name"] if rng.random() < 0.7 else classes[0]["name"]
+        name = f"Class{i}"
+        parent_names = names[parent]
+        vtable = [dict(m, is_implemented_by_current_class=False) for m in vtables[parent]]
+
+        for slot in rng.sample(range(1, len(vtable)), min(len(vtable) - 1, rng.randint(0, 10))):
+            vtable[slot] = _method(name, parent_names[slot], slot, False, True)
+
+        new_names = [f"method{i}_{j}" for j in range(rng.randint(0, 8))]
+        is_abstract = rng.random() < 0.1
+        for j, method_name in enumerate(new_names, start=len(vtable)):
+            vtable.append(_method(name, method_name, j, is_abstract and rng.random() < 0.5, True))
+
+        # Concrete classes must implement all pure virtual methods
+        is_abstract = any(m["is_pure_virtual"] for m in vtable) and (is_abstract or rng.random() < 0.5)
+        if not is_abstract:
+            for slot, method in enumerate(vtable):
+                if method["is_pure_virtual"]:
+                    vtable[slot] = _method(name, (parent_names + new_names)[slot], slot, False, True)
+
+        classes.append({"name": name, "parent": parent, "is_abstract": is_abstract})
+        names[name] = parent_names + new_names
+        vtables[name] = vtable
+
+    return classes, vtables
+
+
+def synthetic_merge(num_classes: int, seed: int = 0) -> tuple[list[ClassInfo], list[MethodPrototype]]:
+    """Run the merge over a synthetic dataset"""
+    classes_json, vtables = synthetic_dataset(num_classes, seed)
+    classes = [ClassInfo.from_dict(c) for c in classes_json]
+    input_methods = {name: [InputMethod.from_dict(m) for m in methods] for name, methods in vtables.items()}
+    return merge_vtables(classes, input_methods)
+
+
+def synthetic_history(num_classes: int, num_releases: int, seed: int = 0) -> list[tuple[list[dict], dict]]:
+    """
+    Generate the merge inputs of consecutive releases: each release retypes some methods (in every vtable having them)
+    and adds new subclasses of existing classes
+    """
+    rng = random.Random(seed)  # noqa: S311
+    classes, vtables = synthetic_dataset(num_classes, seed)
+    releases = [(classes, vtables)]
+    for release in range(1, num_releases):
+        classes, vtables = list(classes), {name: list(methods) for name, methods in vtables.items()}
+        # The last method of a class is its own, unless it has none
+        retyped = {methods[-1]["mangled_name"] for methods in rng.sample(list(vtables.values()), num_classes // 50)}
+        for methods in vtables.values():
+            for slot, method in enumerate(methods):
+                if method["mangled_name"] in retyped:
+                    methods[slot] = {**method, "return_type": f"kern_return_t_{release}"}
+
+        for i in range(num_classes // 100):
+            parent = rng.choice(classes)["name"]
+            name = f"Release{release}Class{i}"
+            vtable = [dict(m, is_implemented_by_current_class=False) for m in vtables[parent]]
+            vtable.extend(
+                _method(name, f"method{release}_{i}_{j}", j, False, True) for j in range(len(vtable), len(vtable) + 2)
+            )
+            classes.append({"name": name, "parent": parent, "is_abstract": any(m["is_pure_virtual"] for m in vtable)})
+            vtables[name] = vtable
+        releases.append((classes, vtables))
+    return releases
+
+
+# endregion
+
+
+# region helpers
+def timed[T](func: Callable[[], T]) -> tuple[T, float]:
+    """Run the function, returning its result and the elapsed seconds"""
+    start = time.perf_counter()
+    result = func()
+    return result, time.perf_counter() - start
+
+
+def report(name: str, samples: list[float]):
+    """Print latency statistics of the samples, in milliseconds"""
+    samples_ms = sorted(s * 1000 for s in samples)
+    p95 = samples_ms[min(len(samples_ms) - 1, int(len(samples_ms) * 0.95))]
+    print(f"{name:<40} n={len(samples_ms):<6} median={statistics.median(samples_ms):9.3f}ms p95={p95:9.3f}ms")
+
+
+# endregion
+
+
+def bench_query_index(classes: list[ClassInfo], prototypes: list[MethodPrototype], queries: int = 200):
+    from query_index import QueryIndex, build_index
+
+    rng = random.Random(0)  # noqa: S311
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "index.sqlite"
+        _, build_time = timed(lambda: build_index(path, classes, prototypes))
+        print(f"Index build: {build_time:.2f}s, size: {path.stat().st_size / 1024 / 1024:.1f}MB")
+
+        index = QueryIndex(path)
+        class_names = [c.name for c in classes]
+        named_prototypes = [p for p in prototypes if p.name] or prototypes
+        mangled = [m.mangled_name for c in classes for m in c.vtable or [] if m.mangled_name] or [""]
+        cases: dict[str, Callable[[], object]] = {
+            "class": lambda: index.find_class(rng.choice(class_names)),
+            "overrides": lambda: index.overriding_classes(rng.choice(named_prototypes).name),
+            "slot": lambda: index.slot_declarations(rng.choice(prototypes).vtable_index),
+            "mangled": lambda: index.find_mangled(rng.choice(mangled)),
+            "subtree": lambda: index.subtree(rng.choice(class_names)),
+        }
+        for name, query in cases.items():
+            report(f"query {name}", [timed(query)[1] for _ in range(queries)])
+        index.close()
+
+
+def bench_search_index(classes: list[ClassInfo], prototypes: list[MethodPrototype], queries: int = 200):
+    from search_index import SearchIndex, build_search_index
+
+    data, build_time = timed(lambda: build_search_index(classes, prototypes))
+    encoded = json.dumps(data, separators=(",", ":")).encode()
+    compressed = gzip.compress(encoded)
+    print(f"Index build: {build_time:.2f}s, size: {len(encoded) / 2**20:.1f}MB, gzip: {len(compressed) / 2**20:.1f}MB")
+    index, load_time = timed(lambda: SearchIndex(json.loads(encoded)))
+    print(f"Index load: {load_time * 1000:.0f}ms, {len(index.terms)} terms")
+
+    rng = random.Random(0)  # noqa: S311
+    lower_terms = [term.lower() for term in index.terms]
+    for length in (2, 4, 8):
+        samples = []
+        for _ in range(queries):
+            term = rng.choice(index.terms)
+            start = rng.randrange(max(1, len(term) - length + 1))
+            samples.append(term[start : start + length])
+        report(f"indexed match, length {length}", [timed(partial(index.matching_terms, q))[1] for q in samples])
+        report(f"indexed search, length {length}", [timed(partial(index.search, q))[1] for q in samples])
+        report(f"linear scan, length {length}", [timed(partial(_linear_scan, lower_terms, q))[1] for q in samples])
+
+
+def bench_bundle(classes: list[ClassInfo], prototypes: list[MethodPrototype], queries: int = 50):
+    from output_bundle import BundleLoader, write_bundle
+
+    rng = random.Random(0)  # noqa: S311
+    with tempfile.TemporaryDirectory() as tmp:
+        classes_path, prototypes_path = Path(tmp) / "classes.json", Path(tmp) / "prototypes.json"
+        bundle = Path(tmp) / "bundle"
+        write_json_atomic(classes_path, classes)
+        write_json_atomic(prototypes_path, prototypes)
+        _, build_time = timed(lambda: write_bundle(bundle, classes, prototypes))
+        shard_sizes = [path.stat().st_size for path in bundle.glob("shard-*.json")]
+        print(
+            f"Monolithic: {(classes_path.stat().st_size + prototypes_path.stat().st_size) / 2**20:.1f}MB, "
+            f"bundle build: {build_time:.2f}s, manifest: {(bundle / 'manifest.json').stat().st_size / 1024:.0f}KB, "
+            f"{len(shard_sizes)} shards, median {statistics.median(shard_sizes) / 1024:.0f}KB"
+        )
+
+        def monolithic_first_class(name: str):
+            all_classes, all_prototypes = read_merged_output(classes_path, prototypes_path)
+            clazz = next(c for c in all_classes if c.name == name)
+            return clazz, [all_prototypes[m.prototype_index] for m in clazz.vtable or []]
+
+        def bundle_first_class(name: str):
+            loader = BundleLoader(bundle)
+            return loader.get_class(name), loader.get_prototypes(name)
+
+        names = [rng.choice(classes).name for _ in range(queries)]
+        report("first class ready, monolithic", [timed(partial(monolithic_first_class, n))[1] for n in names[:5]])
+        report("first class ready, bundle", [timed(partial(bundle_first_class, n))[1] for n in names])
+
+        loader = BundleLoader(bundle)
+        report("next class, bundle (warm LRU)", [timed(partial(loader.get_prototypes, n))[1] for n in names])
+        print(f"LRU: {loader.hits} hits, {loader.misses} misses")
+
+
+def _linear_scan(lower_terms: list[str], query: str) -> list[str]:
+    query = query.lower()
+    return [term for term in lower_terms if query in term]
+
+
+def bench_ingest(classes_file: Path, methods_folder: Path):
+    from merge_vtable_and_classes import load_input_methods
+
+    with open(classes_file) as f:
+        class_names = frozenset(c["name"] for c in json.load(f))
+    files = list(methods_folder.glob("*"))
+    print(f"Input: {len(files)} files, {sum(f.stat().st_size for f in files) / 2**20:.1f}MB")
+
+    serial, serial_time = timed(lambda: load_input_methods(methods_folder, class_names))
+    print(f"jobs=1: {serial_time:.2f}s")
+    for jobs in (2, 4, 8):
+        parallel, parallel_time = timed(lambda: load_input_methods(methods_folder, class_names, jobs))  # noqa: B023
+        identical = "identical" if parallel == serial else "DIFFERENT"
+        print(f"jobs={jobs}: {parallel_time:.2f}s, speedup {serial_time / parallel_time:.2f}x, {identical}")
+
+
+def bench_incremental(classes_file: Path, methods_folder: Path):
+    from incremental_merge import IncrementalMerge
+    from methods_stream import STREAM_SUFFIX, load_methods_file, write_methods_stream
+
+    with tempfile.TemporaryDirectory() as tmp, contextlib.redirect_stdout(io.StringIO()):
+        # Work on a copy, as a methods file is rewritten below
+        input_folder = Path(tmp) / "input"
+        input_folder.mkdir()
+        for path in methods_folder.glob("*"):
+            write_methods_stream(load_methods_file(path).items(), input_folder / (path.stem + STREAM_SUFFIX))
+
+        merge = IncrementalMerge(classes_file, input_folder, None, Path(tmp) / "classes.json", Path(tmp) / "p.json")
+        _, full_time = timed(merge.full_merge)
+
+        # Re-extract a single kext: change the return type of a method it implements
+        rng = random.Random(0)  # noqa: S311
+        changed = rng.choice([path for path, methods in merge.file_methods.items() if methods])
+        data = load_methods_file(changed)
+        methods = next(iter(data.values()))
+        methods[-1]["return_type"] = "kern_return_t"
+        write_methods_stream(data.items(), changed)
+
+        remerged, update_time = timed(lambda: merge.update_files([changed]))
+        with merge.classes_output.open() as f1, merge.prototypes_output.open() as f2:
+            incremental_output = (f1.read(), f2.read())
+        merge.full_merge()
+        with merge.classes_output.open() as f1, merge.prototypes_output.open() as f2:
+            identical = "identical" if incremental_output == (f1.read(), f2.read()) else "DIFFERENT"
+
+    print(f"Full merge: {full_time:.2f}s")
+    print(f"Re-merge of {changed.name}: {update_time:.3f}s, {len(remerged)} classes, {identical} to a full merge")
+
+
+def bench_symbols(classes_file: Path, methods_folder: Path, lost: float = 0.3):
+    from merge_vtable_and_classes import load_input_methods
+    from methods_stream import load_methods_file
+    from symbol_sources import SymbolIndex, SymbolSource
+
+    with open(classes_file) as f:
+        classes_json = json.load(f)
+    class_names = frozenset(c["name"] for c in classes_json)
+    vtables: dict[str, list[dict]] = {}
+    for path in sorted(methods_folder.glob("*")):
+        vtables.update(load_methods_file(path))
+
+    rng = random.Random(0)  # noqa: S311
+
+    def write_degraded(path: Path):
+        """Write the input with a random part of its symbols lost, as in a release missing them"""
+        degraded = {
+            name: [{**m, **_stripped(m)} if rng.random() < lost else m for m in methods]
+            for name, methods in vtables.items()
+        }
+        with path.open("w") as f:
+            json.dump(degraded, f)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        input_folder = Path(tmp) / "input"
+        input_folder.mkdir()
+        write_degraded(input_folder / "methods.json")
+        sources = []
+        for i in range(20):
+            write_degraded(Path(tmp) / f"release{i}.json")
+            sources.append(SymbolSource(Path(tmp) / f"release{i}.json", i % 3))
+
+        for count in (0, 1, 5, 20):
+
+            def merge():
+                input_methods = load_input_methods(input_folder, class_names)
+                index, index_time = timed(lambda: SymbolIndex.build(sources[:count], class_names))  # noqa: B023
+                provenance = index.apply(input_methods)
+                merge_vtables([ClassInfo.from_dict(c) for c in classes_json], input_methods)
+                return provenance, index_time
+
+            with contextlib.redirect_stdout(io.StringIO()):
+                (provenance, index_time), merge_time = timed(merge)
+            filled = sum(len(slots) for slots in provenance.values())
+            print(f"{count:>2} sources: merge {merge_time:.2f}s, index {index_time:.2f}s, {filled} slots filled")
+
+
+def bench_delta(classes_file: Path, methods_folder: Path):
+    from merge_vtable_and_classes import load_input_methods
+    from methods_stream import STREAM_SUFFIX, class_depth, load_methods_file, write_methods_stream
+
+    with open(classes_file) as f:
+        classes_json = json.load(f)
+    class_names = frozenset(c["name"] for c in classes_json)
+    parents = {c["name"]: c["parent"] for c in classes_json if c["parent"]}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        folders = {"full": Path(tmp) / "full", "delta": Path(tmp) / "delta"}
+        for folder in folders.values():
+            folder.mkdir()
+        for path in sorted(methods_folder.glob("*")):
+            # In extraction order: parents first
+            items = sorted(load_methods_file(path).items(), key=lambda item: class_depth(item[0], parents))
+            name = path.with_suffix(STREAM_SUFFIX).name
+            write_methods_stream(items, folders["full"] / name)
+            write_methods_stream(items, folders["delta"] / name, parents)
+
+        print(f"{'input':>6}: {_folder_size(methods_folder) / 2**20:.1f}MB")
+        results = {}
+        for mode, folder in folders.items():
+            results[mode], parse_time = timed(lambda: load_input_methods(folder, class_names))  # noqa: B023
+            print(f"{mode:>6}: {_folder_size(folder) / 2**20:.1f}MB, parsed in {parse_time:.2f}s")
+        print("Delta input is " + ("identical" if results["full"] == results["delta"] else "DIFFERENT"))
+
+
+def _folder_size(folder: Path) -> int:
+    return sum(path.stat().st_size for path in folder.glob("*"))
+
+
+def _stripped(method: dict) -> dict:
+    unknown_name = f"sub_{method['vtable_index']:x}"
+    return {"name": unknown_name, "mangled_name": unknown_name, "return_type": "???", "parameters": [{"type": "???"}]}
+
+
+def bench_stream(num_classes: int):
+    from methods_stream import read_methods_stream, write_methods_stream
+
+    def extract():
+        """Simulates kdk_extract_vtable.iter_methods over large vtables, creating each class' methods on demand"""
+        rng = random.Random(0)  # noqa: S311
+        for i in range(num_classes):
+            name = f"Class{i}"
+            yield name, [_method(name, f"method{j}", j, False, True) for j in range(rng.randint(100, 600))]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        full_path, stream_path = Path(tmp) / "methods.json", Path(tmp) / "methods.jsonl"
+
+        tracemalloc.start()
+        with full_path.open("w") as f:
+            json.dump(dict(extract()), f, indent=4)
+        _, full_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tracemalloc.start()
+        write_methods_stream(extract(), stream_path)
+        _, stream_peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        with full_path.open() as f:
+            identical = "identical" if dict(read_methods_stream(stream_path)) == json.load(f) else "DIFFERENT"
+        print(f"dict + json.dump: peak {full_peak / 2**20:.1f}MB, file {full_path.stat().st_size / 2**20:.1f}MB")
+        print(f"stream:           peak {stream_peak / 2**20:.1f}MB, file {stream_path.stat().st_size / 2**20:.1f}MB")
+        print(f"Converted stream is {identical} to the dict output")
+
+
+def write_synthetic_input(directory: Path, num_classes: int, num_files: int) -> tuple[Path, Path]:
+    """Write a synthetic dataset as a classes.json and a folder of per-kext methods files"""
+    classes, vtables = synthetic_dataset(num_classes)
+    classes_file = directory / "classes.json"
+    with classes_file.open("w") as f:
+        json.dump(classes, f, indent=4)
+
+    methods_folder = directory / "out"
+    methods_folder.mkdir()
+    items = list(vtables.items())
+    for i in range(num_files):
+        with (methods_folder / f"kext{i}.json").open("w") as f:
+            json.dump(dict(items[i::num_files]), f, indent=4)
+    return classes_file, methods_folder
+
+
+def bench_archive(num_classes: int, num_releases: int = 20):
+    from release_archive import ReleaseArchive
+
+    with tempfile.TemporaryDirectory() as tmp:
+        archive_dir, raw_size, outputs = Path(tmp) / "archive", 0, {}
+        archive = ReleaseArchive(archive_dir)
+        for release, (classes_json, vtables) in enumerate(synthetic_history(num_classes, num_releases)):
+            classes = [ClassInfo.from_dict(c) for c in classes_json]
+            input_methods = {name: [InputMethod.from_dict(m) for m in methods] for name, methods in vtables.items()}
+            with contextlib.redirect_stdout(io.StringIO()):
+                classes, prototypes = merge_vtables(classes, input_methods)
+            outputs[f"release{release}"] = output = (_dumps(classes), _dumps(prototypes))
+            raw_size += sum(len(text) for text in output)
+            archive.add(f"release{release}", classes, prototypes)
+
+        archive_size = sum(path.stat().st_size for path in archive_dir.glob("*"))
+        print(f"{num_releases} releases: {raw_size / 2**20:.1f}MB as classes.json + prototypes.json")
+        print(f"Archive: {archive_size / 2**20:.1f}MB ({raw_size / archive_size:.1f}x smaller)")
+        print(f"Dictionary: {(archive_dir / 'dictionary.json').stat().st_size / 2**20:.1f}MB")
+
+        for release, output in outputs.items():
+            # Cold: a new archive object, loading the dictionary and the base as well
+            (classes, prototypes), cold_time = timed(lambda: ReleaseArchive(archive_dir).load(release))  # noqa: B023
+            identical = "identical" if (_dumps(classes), _dumps(prototypes)) == output else "DIFFERENT"
+            _, warm_time = timed(lambda: archive.load(release))  # noqa: B023
+            delta_size = (archive_dir / archive.manifest["releases"][release]).stat().st_size
+            print(
+                f"{release:>10}: delta {delta_size / 1024:6.1f}KB, materialized in {cold_time:.3f}s cold, "
+                f"{warm_time:.3f}s warm, {identical}"
+            )
+
+        rng = random.Random(0)  # noqa: S311
+        # Classes of the first release are in all of them
+        base_classes = json.loads(outputs["release0"][0])
+        queries = [(rng.choice(list(outputs)), rng.choice(base_classes)["name"]) for _ in range(200)]
+
+        def cold_class(release: str, class_name: str):
+            return ReleaseArchive(archive_dir).get_class(release, class_name)
+
+        report("single class, cold", [timed(partial(cold_class, *query))[1] for query in queries[:10]])
+        report("single class, warm", [timed(partial(archive.get_class, *query))[1] for query in queries])
+
+
+def _dumps(data: object) -> str:
+    return json.dumps(data, cls=EnhancedJSONEncoder)
+
+
+# Benchmarks over the merge output: (classes, prototypes)
+OUTPUT_BENCHMARKS: dict[str, Callable[[list[ClassInfo], list[MethodPrototype]], None]] = {
+    "query-index": bench_query_index,
+    "search-index": bench_search_index,
+    "bundle": bench_bundle,
+}
+# Benchmarks over the merge input: (classes.json, methods folder)
+INPUT_BENCHMARKS: dict[str, Callable[[Path, Path], None]] = {
+    "ingest": bench_ingest,
+    "incremental": bench_incremental,
+    "symbols": bench_symbols,
+    "delta": bench_delta,
+}
+
+# Benchmarks generating their own synthetic data: (number of classes)
+SYNTHETIC_BENCHMARKS: dict[str, Callable[[int], None]] = {
+    "stream": bench_stream,
+    "archive": bench_archive,
+}
+
+
+def main(args):
+    parser = argparse.ArgumentParser(prog="benchmarks.py")
+    subparsers = parser.add_subparsers(dest="benchmark", required=True)
+    for name in OUTPUT_BENCHMARKS:
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--synthetic", type=int, metavar="N", help="use a synthetic hierarchy of N classes")
+        subparser.add_argument("classes_file", nargs="?", type=Path, default=CLASSES_OUTPUT)
+        subparser.add_argument("prototypes_file", nargs="?", type=Path, default=PROTOTYPES_OUTPUT)
+    for name in INPUT_BENCHMARKS:
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--synthetic", type=int, metavar="N", help="use a synthetic hierarchy of N classes")
+        subparser.add_argument("--files", type=int, default=300, help="number of synthetic methods files")
+        subparser.add_argument("classes_file", nargs="?", type=Path)
+        subparser.add_argument("methods_folder", nargs="?", type=Path)
+    for name in SYNTHETIC_BENCHMARKS:
+        subparser = subparsers.add_parser(name)
+        subparser.add_argument("--synthetic", type=int, metavar="N", default=1000, help="number of synthetic classes")
+    options = parser.parse_args(args)
+
+    if options.benchmark in SYNTHETIC_BENCHMARKS:
+        SYNTHETIC_BENCHMARKS[options.benchmark](options.synthetic)
+        return
+
+    if options.benchmark in INPUT_BENCHMARKS:
+        with tempfile.TemporaryDirectory() as tmp:
+            if options.synthetic:
+                classes_file, methods_folder = write_synthetic_input(Path(tmp), options.synthetic, options.files)
+            elif options.classes_file and options.methods_folder:
+                classes_file, methods_folder = options.classes_file, options.methods_folder
+            else:
+                parser.error("either --synthetic or classes_file and methods_folder are required")
+            INPUT_BENCHMARKS[options.benchmark](classes_file, methods_folder)
+        return
+
+    if options.synthetic:
+        classes, prototypes = synthetic_merge(options.synthetic)
+    else:
+        classes, prototypes = read_merged_output(options.classes_file, options.prototypes_file)
+    print(f"Dataset: {len(classes)} classes, {len(prototypes)} prototypes")
+    OUTPUT_BENCHMARKS[options.benchmark](classes, prototypes)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,61 @@
+"""
+Duration history of per-file extractions, used to schedule the longest files first and to predict the remaining time.
+
+Entries are keyed by file name and size, so a file that changed is predicted again from its size.
+"""
+
+import json
+import statistics
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+HISTORY_FILE = Path("history.json")
+# Used to predict durations by size before there is any history
+DEFAULT_SECONDS_PER_MB = 2.0
+
+
+@dataclass
+class HistoryEntry:
+    size: int
+    duration: float
+
+
+class ExtractionHistory:
+    def __init__(self, path: Path = HISTORY_FILE):
+        self.path = path
+        self.entries: dict[str, HistoryEntry] = {}
+        if path.exists():
+            with path.open() as f:
+                self.entries = {key: HistoryEntry(**entry) for key, entry in json.load(f).items()}
+        self._seconds_per_byte = self._estimate_seconds_per_byte()
+
+    @staticmethod
+    def key(path: Path) -> str:
+        return f"{path.name}:{path.stat().st_size}"
+
+    def predict(self, path: Path) -> float:
+        """Predicted duration in seconds: the last duration of the same file, or an estimate from its size"""
+        entry = self.entries.get(self.key(path))
+        if entry is not None:
+            return entry.duration
+        return path.stat().st_size * self._seconds_per_byte
+
+    def schedule(self, files: list[Path], recorded_path: Callable[[Path], Path] = lambda path: path) -> list[Path]:
+        """Order files longest first. `recorded_path` maps a file to the path its durations are recorded for."""
+        return sorted(files, key=lambda path: self.predict(recorded_path(path)), reverse=True)
+
+    def record(self, path: Path, duration: float):
+        self.entries[self.key(path)] = HistoryEntry(path.stat().st_size, duration)
+
+    def save(self):
+        temp = self.path.with_suffix(".tmp")
+        with temp.open("w") as f:
+            json.dump({key: asdict(entry) for key, entry in self.entries.items()}, f, indent=4)
+        temp.replace(self.path)
+
+    def _estimate_seconds_per_byte(self) -> float:
+        rates = [entry.duration / entry.size for entry in self.entries.values() if entry.size]
+        if not rates:
+            return DEFAULT_SECONDS_PER_MB / 2**20
+        return statistics.median(rates)
@@ -0,0 +1,118 @@
+"""
+Run a worker on each file in a child process, under a wall-clock timeout and a memory (RSS) ceiling.
+
+A file whose worker exceeds a limit is killed and recorded, and the run continues with the next file.
+The worker is any picklable callable taking the file path (and optional extra arguments), so the supervisor does not
+depend on IDA.
+"""
+
+import contextlib
+import json
+import multiprocessing
+import subprocess
+import time
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from pathlib import Path
+
+try:
+    import psutil  # pyright: ignore[reportMissingImports]
+except ModuleNotFoundError:
+    psutil = None
+
+STATUS_OK = "ok"
+STATUS_FAILED = "failed"
+STATUS_TIMEOUT = "timeout"
+STATUS_MEMORY = "memory"
+
+
+@dataclass
+class FileResult:
+    path: str
+    status: str
+    duration: float
+    peak_rss: int
+    exit_code: int | None
+
+
+def read_rss(pid: int) -> int:
+    """Resident set size of the process in bytes, or 0 if it cannot be read"""
+    if psutil is not None:
+        with contextlib.suppress(psutil.Error):
+            return psutil.Process(pid).memory_info().rss
+        return 0
+
+    # Works on both macOS and Linux
+    result = subprocess.run(["ps", "-o", "rss=", "-p", str(pid)], capture_output=True, text=True, check=False)  # noqa: S603, S607
+    return int(result.stdout.strip() or 0) * 1024
+
+
+class Supervisor:
+    def __init__(
+        self,
+        worker: Callable[..., object],
+        timeout: float | None = None,
+        max_rss: int | None = None,
+        poll_interval: float = 0.5,
+        rss_reader: Callable[[int], int] = read_rss,
+    ):
+        self.worker = worker
+        self.timeout = timeout
+        self.max_rss = max_rss
+        self.poll_interval = poll_interval
+        self.rss_reader = rss_reader
+        # idalib is not fork safe, so start every worker from a fresh interpreter
+        self.context = multiprocessing.get_context("spawn")
+        self.results: list[FileResult] = []
+
+    def run(self, path: Path, *args) -> FileResult:
+        """Call the worker with the file and args in a child process, killing it if it exceeds a limit"""
+        process = self.context.Process(target=self.worker, args=(path, *args), name=f"worker-{path.name}")
+        start = time.monotonic()
+        process.start()
+
+        status = None
+        peak_rss = 0
+        while True:
+            process.join(self.poll_interval)
+            if process.exitcode is not None:
+                break
+
+            peak_rss = max(peak_rss, self.rss_reader(process.pid))
+            if self.timeout is not None and time.monotonic() - start > self.timeout:
+                status = STATUS_TIMEOUT
+            elif self.max_rss is not None and peak_rss > self.max_rss:
+                status = STATUS_MEMORY
+            if status is not None:
+                process.kill()
+                process.join()
+                break
+
+        if status is None:
+            status = STATUS_OK if process.exitcode == 0 else STATUS_FAILED
+        result = FileResult(str(path), status, time.monotonic() - start, peak_rss, process.exitcode)
+        process.close()
+
+        if status != STATUS_OK:
+            print(f"[Warning] {path.name}: {status} after {result.duration:.0f}s (peak rss {peak_rss / 2**20:.0f}MB)")
+        self.results.append(result)
+        return result
+
+    def record_failure(self, path: Path, error: str) -> FileResult:
+        """Record a file that failed before its worker could run, e.g. while it was prepared"""
+        print(f"[Warning] {path.name}: {STATUS_FAILED} before processing: {error}")
+        result = FileResult(str(path), STATUS_FAILED, 0.0, 0, None)
+        self.results.append(result)
+        return result
+
+    def write_report(self, path: Path, slow_threshold: float):
+        """Write the skipped files and the files slower than the threshold (in seconds), slowest first"""
+        by_duration = sorted(self.results, key=lambda r: r.duration, reverse=True)
+        report = {
+            "skipped": [asdict(r) for r in by_duration if r.status != STATUS_OK],
+            "slow": [asdict(r) for r in by_duration if r.status == STATUS_OK and r.duration >= slow_threshold],
+            "total_files": len(self.results),
+            "total_duration": sum(r.duration for r in self.results),
+        }
+        with path.open("w") as f:
+            json.dump(report, f, indent=4)
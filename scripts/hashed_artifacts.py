@@ -0,0 +1,189 @@
+"""
+Content-hashed, precompressed copies of the merge output, which a static host and clients can cache forever.
+
+For each output file, writes <stem>.<hash>.json and a precompressed variant per available codec
+(<stem>.<hash>.json.gz, .br, .zst), and a manifest.json mapping the output names to their current files.
+Only the manifest changes name-stably, so it is the only file a client has to re-fetch.
+
+gzip is always available, brotli and zstd need the `brotli` and `zstandard` packages (or Python 3.14's compression.zstd).
+Hashed copies of the written outputs referenced by neither the new nor the previous manifest are removed. Other files
+in the directory (an index.html, a favicon...) are left alone.
+
+Usage: hashed_artifacts.py build out_dir [classes.json prototypes.json]
+       hashed_artifacts.py fetch base_url name cache_dir
+"""
+
+import gzip
+import hashlib
+import json
+import re
+import sys
+import time
+import urllib.request
+from collections.abc import Callable
+from dataclasses import dataclass
+from pathlib import Path
+
+from merge_vtable_and_classes import CLASSES_OUTPUT, PROTOTYPES_OUTPUT, write_text_atomic
+
+try:
+    import brotli  # pyright: ignore[reportMissingImports]
+except ModuleNotFoundError:
+    brotli = None
+
+try:
+    from compression import zstd  # pyright: ignore[reportMissingImports]
+except ModuleNotFoundError:
+    try:
+        import zstandard as zstd  # pyright: ignore[reportMissingImports]
+    except ModuleNotFoundError:
+        zstd = None
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+HASH_LENGTH = 16
+# Every codec this module may have written, available here or not
+CODEC_SUFFIXES = (".gz", ".br", ".zst")
+
+
+@dataclass
+class Codec:
+    name: str
+    suffix: str
+    compress: Callable[[bytes], bytes]
+    decompress: Callable[[bytes], bytes]
+
+
+def available_codecs() -> list[Codec]:
+    # mtime=0 so the same content always compresses to the same bytes
+    codecs = [Codec("gzip", ".gz", lambda data: gzip.compress(data, 9, mtime=0), gzip.decompress)]
+    if brotli is not None:
+        codecs.append(Codec("br", ".br", lambda data: brotli.compress(data, quality=11), brotli.decompress))
+    if zstd is not None:
+        codecs.append(Codec("zstd", ".zst", lambda data: zstd.compress(data, 19), zstd.decompress))
+    return codecs
+
+
+def hashed_name(name: str, digest: str) -> str:
+    stem, dot, suffix = name.rpartition(".")
+    return f"{stem}.{digest[:HASH_LENGTH]}{dot}{suffix}" if dot else f"{name}.{digest[:HASH_LENGTH]}"
+
+
+def managed_name_pattern(names: list[str]) -> re.Pattern:
+    """Matches the names `hashed_name` gives to any content of these files, and their compressed variants"""
+    digest = f"[0-9a-f]{{{HASH_LENGTH}}}"
+    hashed = []
+    for name in names:
+        stem, dot, suffix = name.rpartition(".")
+        hashed.append(rf"{re.escape(stem)}\.{digest}\.{re.escape(suffix)}" if dot else rf"{re.escape(name)}\.{digest}")
+    codecs = "|".join(re.escape(suffix) for suffix in CODEC_SUFFIXES)
+    return re.compile(f"(?:{'|'.join(hashed)})(?:{codecs})?")
+
+
+def write_artifacts(directory: str | Path, files: dict[str, bytes]) -> dict:
+    """Write the hashed and compressed variants of the files (name -> content) and the manifest, which is returned"""
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    codecs = available_codecs()
+
+    entries = {}
+    for name, data in files.items():
+        digest = hashlib.sha256(data).hexdigest()
+        file_name = hashed_name(name, digest)
+        encodings = {}
+        # Same content, same names: what is already there is up to date
+        if not (directory / file_name).exists():
+            _write_bytes_atomic(directory / file_name, data)
+        for codec in codecs:
+            path = directory / (file_name + codec.suffix)
+            if not path.exists():
+                _write_bytes_atomic(path, codec.compress(data))
+            encodings[codec.name] = {"file": path.name, "size": path.stat().st_size}
+        entries[name] = {"file": file_name, "sha256": digest, "size": len(data), "encodings": encodings}
+
+    manifest_path = directory / MANIFEST_NAME
+    previous = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"files": {}}
+    manifest = {"version": FORMAT_VERSION, "files": entries}
+    write_text_atomic(manifest_path, json.dumps(manifest, indent=4))
+
+    # Keep the files of the previous manifest, for clients that fetched it just before
+    referenced = _manifest_files(manifest) | _manifest_files(previous)
+    managed = managed_name_pattern(list(files))
+    for path in directory.iterdir():
+        if path.is_file() and path.name not in referenced and managed.fullmatch(path.name):
+            path.unlink()
+    return manifest
+
+
+def _write_bytes_atomic(path: Path, data: bytes):
+    # Existing files are trusted to be complete, so never leave a partial one under the final name
+    temp = path.with_name(path.name + ".tmp")
+    temp.write_bytes(data)
+    temp.replace(path)
+
+
+def _manifest_files(manifest: dict) -> set[str]:
+    names = set()
+    for entry in manifest["files"].values():
+        names.add(entry["file"])
+        names.update(encoding["file"] for encoding in entry["encodings"].values())
+    return names
+
+
+def fetch_artifact(base_url: str, name: str, cache_dir: Path) -> bytes:
+    """
+    Fetch an output file through the manifest at base_url, downloading it gzipped only if it is not cached yet.
+    Cached files are named by their hash, so they never need to be revalidated.
+    """
+    with urllib.request.urlopen(f"{base_url}/{MANIFEST_NAME}") as response:  # noqa: S310
+        entry = json.load(response)["files"][name]
+
+    cached = cache_dir / entry["file"]
+    if cached.exists():
+        return cached.read_bytes()
+
+    with urllib.request.urlopen(f"{base_url}/{entry['encodings']['gzip']['file']}") as response:  # noqa: S310
+        data = gzip.decompress(response.read())
+    if hashlib.sha256(data).hexdigest() != entry["sha256"]:
+        raise ValueError(f"Hash mismatch for {name} from {base_url}")
+    cache_dir.mkdir(parents=True, exist_ok=True)
+    cached.write_bytes(data)
+    return data
+
+
+def print_report(directory: str | Path, manifest: dict):
+    """Print the size of each compressed variant and the time to decode it"""
+    directory = Path(directory)
+    codecs = {codec.name: codec for codec in available_codecs()}
+    for name, entry in manifest["files"].items():
+        print(f"{name}: {entry['size'] / 2**20:.2f}MB -> {entry['file']}")
+        for codec_name, encoding in entry["encodings"].items():
+            compressed = (directory / encoding["file"]).read_bytes()
+            start = time.perf_counter()
+            codecs[codec_name].decompress(compressed)
+            decode_time = time.perf_counter() - start
+            ratio = encoding["size"] / entry["size"] if entry["size"] else 0
+            print(
+                f"  {codec_name:<5} {encoding['size'] / 2**20:8.2f}MB ({ratio:6.1%})"
+                f"  decode {decode_time * 1000:7.1f}ms"
+            )
+
+
+def main(args):
+    if len(args) in (2, 4) and args[0] == "build":
+        paths = [Path(p) for p in args[2:4]] or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT]
+        manifest = write_artifacts(args[1], {path.name: path.read_bytes() for path in paths})
+        print_report(args[1], manifest)
+        return
+
+    if len(args) != 4 or args[0] != "fetch":
+        print("Usage: hashed_artifacts.py build out_dir [classes.json prototypes.json]")
+        print("       hashed_artifacts.py fetch base_url name cache_dir")
+        return
+
+    data = fetch_artifact(args[1], args[2], Path(args[3]))
+    print(f"{args[2]}: {len(data)} bytes")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
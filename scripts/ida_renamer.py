@@ -1,69 +1,38 @@
+import functools
 import json
 import re
-import urllib.request
-from typing import NamedTuple, TypedDict
 
 import ida_funcs
+import renamer_data
 from ida_typeinf import tinfo_t, udt_type_data_t
 from idahelper import cpp, functions, memory, strings, tif, xrefs
 
-GENERIC_FUNCTION_TYPE_PATTERN = re.compile(r"(__int64|void) \(__fastcall \*\)\((\w+) \*__hidden this\)")
-
-OS_METACLASS_BASE = "OSMetaClassBase"
-OS_OBJECT = "OSObject"
-
-OS_OBJECT_PTR_TYPE: tinfo_t = tif.from_c_type(OS_OBJECT + "*")
-assert OS_OBJECT_PTR_TYPE is not None, f"Failed to create type for {OS_OBJECT}*"
-
-
-# region Types of prototypes.json
-class Parameter(TypedDict):
-    """Function parameter type from prototypes.json"""
-
-    type: str
-    name: str
-
-
-class Prototype(TypedDict):
-    """Function prototype type from prototypes.json"""
-
-    name: str
-    mangledName: str
-    returnType: str
-    parameters: list[Parameter]
-    vtableIndex: int
-    declaringClass: str
-    protoIndex: int
-
-
-# endregion
-
-
-# region Types of classes.json
-class VtableEntry(NamedTuple):
-    prototype_index: int
-    is_overridden: bool
-    is_pure_virtual: bool
-    mangled_name: str | None
-
+# Re-exported, they used to be defined here
+from renamer_data import (  # noqa: F401
+    OS_METACLASS_BASE,
+    OS_OBJECT,
+    Clazz,
+    Parameter,
+    Prototype,
+    RenameStats,
+    VtableEntry,
+    get_methods_for_type,
+    parse_classes,
+    unknown_to_int64,
+)
 
-class Clazz(TypedDict):
-    name: str
-    parent: str | None
-    isAbstract: bool
-    vtable: list[VtableEntry] | None
-
-
-# endregion
+GENERIC_FUNCTION_TYPE_PATTERN = re.compile(r"(__int64|void) \(__fastcall \*\)\((\w+) \*__hidden this\)")
 
 
-def unknown_to_int64(typ: str) -> str:
-    """Convert an unknown type (???) to a known type, defaulting to __int64."""
-    if typ == "???":
-        return "__int64"
-    return typ.replace(OS_METACLASS_BASE, OS_OBJECT)
+# region Per-database values, computed on first use. See `reset_database_caches`.
+@functools.cache
+def _os_object_ptr_type() -> tinfo_t:
+    typ = tif.from_c_type(OS_OBJECT + "*")
+    assert typ is not None, f"Failed to create type for {OS_OBJECT}*"
+    return typ
 
 
+@functools.cache
 def _pure_virtual_function_ea() -> int:
     """Locate __cxa_pure_virtual function. Return its start ea"""
     # Try to find the pure virtual function by its name
@@ -82,7 +51,22 @@ def _pure_virtual_function_ea() -> int:
     return pure_virtual_func_ea
 
 
-pure_virtual_function_ea = _pure_virtual_function_ea()
+def reset_database_caches():
+    """Forget the values of the previously open database"""
+    _os_object_ptr_type.cache_clear()
+    _pure_virtual_function_ea.cache_clear()
+
+
+def __getattr__(name: str):
+    # `OS_OBJECT_PTR_TYPE` and `pure_virtual_function_ea` are still values, of the open database
+    if name == "OS_OBJECT_PTR_TYPE":
+        return _os_object_ptr_type()
+    if name == "pure_virtual_function_ea":
+        return _pure_virtual_function_ea()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
+# endregion
 
 
 class ClassVtableRenamer:
@@ -91,6 +75,7 @@ class ClassVtableRenamer:
         self.vtable_ea: int = vtable_ea
         self.is_verbose = is_verbose
         self.force_apply = force_apply
+        self.slots_retyped = 0
         self.vtable_type: tinfo_t = tif.vtable_type_from_type(class_type)
         self.vtable_type_udt: udt_type_data_t = tif.get_udt(self.vtable_type)
 
@@ -126,17 +111,19 @@ class ClassVtableRenamer:
             # Remove the newly created gap in the vtable type
             self.vtable_type.expand_udt(1, -(member.size // 8))
 
-    def apply(self, methods: list[tuple[Prototype, str | None]]):
+    def apply(self, methods: list[tuple[Prototype, str | None]]) -> bool:
+        """Rename and retype the vtable. Returns False if the type is rejected."""
         # Verify the type is not buggy
         if methods and methods[0][0]["name"] != "~OSObject":
             print(f"[Error] Type {self.class_type} has unexpected first method: {methods[0][0]['name']}")
-            return
+            return False
 
         for entry in cpp.iterate_vtable(self.vtable_ea, skip_reserved=False):
             if entry.index < len(methods):
                 self._rename_method(entry, *methods[entry.index])
             else:
                 self._rename_unknown(entry)
+        return True
 
     def _rename_method(self, entry: cpp.VTableItem, prototype: Prototype, mangled_name: str | None):
         vtable_type_member = self.vtable_type_udt[entry.index]
@@ -154,12 +141,13 @@ class ClassVtableRenamer:
         func_type = self._build_func_type(self.class_type, prototype, entry.func_ea)
         if func_type is not None and (self.force_apply or is_default_vtable_method_type(vtable_type_member.type)):
             self.vtable_type.set_udm_type(entry.index, tif.pointer_of(func_type))
+            self.slots_retyped += 1
 
         # Only touch the function itself if it is an override or defined by this class
         if (
             not self.is_override(entry.vtable_offset)
             or not functions.is_in_function(entry.func_ea)
-            or entry.func_ea == pure_virtual_function_ea
+            or entry.func_ea == _pure_virtual_function_ea()
         ):
             return
 
@@ -194,7 +182,7 @@ class ClassVtableRenamer:
 
         # Don't rename pure virtual functions or functions that are not overrides or non functions
         if (
-            entry.func_ea == pure_virtual_function_ea
+            entry.func_ea == _pure_virtual_function_ea()
             or not self.is_override(entry.vtable_offset)
             or not functions.is_in_function(entry.func_ea)
         ):
@@ -240,7 +228,7 @@ class ClassVtableRenamer:
                 for arg in range(1, func_type.get_nargs()):
                     arg_type = func_type.get_nth_arg(arg)
                     if arg_type.is_ptr() and arg_type.get_pointed_object().get_type_name() == OS_METACLASS_BASE:
-                        func_type.set_funcarg_type(arg, OS_OBJECT_PTR_TYPE)
+                        func_type.set_funcarg_type(arg, _os_object_ptr_type())
 
                 return func_type
 
@@ -281,41 +269,32 @@ def rename_udm_with_retry(typ: tinfo_t, udm_index: int, new_name: str):
         suffix = str(j)
 
 
-## memory vtables utils
-def get_methods_for_type(
-    prototypes: list[Prototype], classes: dict[str, Clazz], type_name: str
-) -> list[tuple[Prototype, str | None]]:
-    """For each type return pairs of (prototype, mangled name) from its vtable"""
-    # search for the first class in the hierarchy chain that it's vtable is not none
-    cls = classes[type_name]
-    while cls.get("vtable") is None:
-        parent = cls.get("parent")
-        if parent is None:
-            print(f"Could not find methods for {type_name}")
-            return []
-        cls = classes[parent]
-
-    return [(prototypes[m.prototype_index], m.mangled_name) for m in cls["vtable"]]
-
-
 def get_file(name: str) -> str:
-    """Given a filename, retrieve it. Override it if you want to use local files instead."""
-    url = f"https://raw.githubusercontent.com/yoavst/IOKitClassExplorer/refs/heads/main/src/{name}"
-    return urllib.request.urlopen(url).read()  # noqa: S310
+    """Given a filename, retrieve it. Override it (or renamer_data.get_file) if you want to use local files instead."""
+    return renamer_data.get_file(name)
 
 
 def get_classes() -> list[Clazz]:
-    classes: list[Clazz] = json.loads(get_file("classes.json"))
-    for cls in classes:
-        cls["vtable"] = [VtableEntry(*m) for m in cls["vtable"] or []] if cls.get("vtable") else None
-    return classes
+    return parse_classes(json.loads(get_file("classes.json")))
 
 
 def apply_renaming(is_verbose: bool, show_progress: bool, force_apply: bool):
     prototypes: list[Prototype] = json.loads(get_file("prototypes.json"))
     classes = get_classes()
     classes_dict: dict[str, Clazz] = {cls["name"]: cls for cls in classes}
-
+    rename_classes(prototypes, classes_dict, is_verbose, show_progress, force_apply)
+
+
+def rename_classes(
+    prototypes: list[Prototype],
+    classes_dict: dict[str, Clazz],
+    is_verbose: bool,
+    show_progress: bool,
+    force_apply: bool,
+) -> RenameStats:
+    """Rename the vtables of all the known classes in the open database"""
+    reset_database_caches()
+    stats = RenameStats()
     for i, (cpp_type, vtable_ea) in enumerate(cpp.get_all_cpp_classes()):
         if show_progress:
             print(f"{i}. {cpp_type} at {vtable_ea:X}")
@@ -324,9 +303,21 @@ def apply_renaming(is_verbose: bool, show_progress: bool, force_apply: bool):
             continue
 
         methods = get_methods_for_type(prototypes, classes_dict, type_name)
-        renamer = ClassVtableRenamer(cpp_type, vtable_ea, is_verbose, force_apply)
-        renamer.remove_rtti_from_vtable()
-        renamer.apply(methods)
+        try:
+            renamer = ClassVtableRenamer(cpp_type, vtable_ea, is_verbose, force_apply)
+            renamer.remove_rtti_from_vtable()
+            applied = renamer.apply(methods)
+        except Exception as e:
+            # One broken type should not stop the renaming of the rest
+            print(f"[Error] Failed to rename {type_name}: {e!r}")
+            applied = False
+
+        if applied:
+            stats.classes_renamed += 1
+            stats.slots_retyped += renamer.slots_retyped
+        else:
+            stats.errors += 1
+    return stats
 
 
 if __name__ == "__main__":
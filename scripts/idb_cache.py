@@ -0,0 +1,134 @@
+"""
+Cache of analyzed IDA databases, so re-running an extraction does not pay for auto-analysis again.
+
+Databases are keyed by the sha256 of the binary: <cache>/<sha256>/<binary name>.i64, described by <cache>/manifest.json.
+An unchanged binary reopens its database without analysis. Least recently used databases are evicted when the
+cache grows over its quota.
+
+The cache is independent of IDA: it drives a `DatabaseBackend`, which is idalib in kdk_mass_extract_vtable.
+"""
+
+import contextlib
+import hashlib
+import json
+import shutil
+import time
+from collections.abc import Iterator
+from dataclasses import asdict, dataclass
+from pathlib import Path
+from typing import Protocol
+
+MANIFEST_NAME = "manifest.json"
+DATABASE_SUFFIX = ".i64"
+
+
+class DatabaseBackend(Protocol):
+    def open(self, path: Path, run_auto_analysis: bool):
+        """Open a binary (creating a database next to it) or an existing database"""
+
+    def close(self, save: bool):
+        """Close the open database"""
+
+
+@dataclass
+class CacheEntry:
+    name: str
+    database: str
+    size: int
+    last_used: float
+
+
+def file_hash(path: Path) -> str:
+    digest = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(1 << 20):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class IdbCache:
+    def __init__(self, cache_dir: Path, backend: DatabaseBackend, quota_bytes: int | None = None):
+        self.cache_dir = cache_dir
+        self.backend = backend
+        self.quota_bytes = quota_bytes
+        self.hits = 0
+        self.misses = 0
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.entries = self._load_manifest()
+
+    @contextlib.contextmanager
+    def open(self, binary: Path, digest: str | None = None) -> Iterator[None]:
+        """Open the analyzed database of the binary, analyzing it only if it is not cached. Hashes it if needed."""
+        digest = digest or file_hash(binary)
+        entry = self.entries.get(digest)
+        if entry is not None and (self.cache_dir / entry.database).exists():
+            self.hits += 1
+            self.backend.open(self.cache_dir / entry.database, False)
+            try:
+                yield
+            finally:
+                # Keep the cached database as it was after the analysis
+                self.backend.close(False)
+            entry.last_used = time.time()
+        else:
+            self.misses += 1
+            entry = self._analyze(binary, digest)
+            try:
+                yield
+            finally:
+                self.backend.close(True)
+                self._finish_entry(digest, entry)
+
+        self.entries[digest] = entry
+        self._evict(keep=digest)
+        self._save_manifest()
+
+    def _analyze(self, binary: Path, digest: str) -> CacheEntry:
+        entry_dir = self.cache_dir / digest
+        shutil.rmtree(entry_dir, ignore_errors=True)
+        entry_dir.mkdir()
+        # The database is created next to the opened binary, so analyze a copy inside the cache
+        staged_binary = entry_dir / binary.name
+        shutil.copyfile(binary, staged_binary)
+        self.backend.open(staged_binary, True)
+        return CacheEntry(binary.name, f"{digest}/{binary.name}{DATABASE_SUFFIX}", 0, time.time())
+
+    def _finish_entry(self, digest: str, entry: CacheEntry):
+        entry_dir = self.cache_dir / digest
+        # The database does not need the binary once it was created
+        (entry_dir / entry.name).unlink(missing_ok=True)
+        entry.size = sum(f.stat().st_size for f in entry_dir.iterdir() if f.is_file())
+
+    def _evict(self, keep: str):
+        """Remove least recently used databases until the cache fits its quota"""
+        if self.quota_bytes is None:
+            return
+        total = sum(entry.size for entry in self.entries.values())
+        for digest, entry in sorted(self.entries.items(), key=lambda item: item[1].last_used):
+            if total <= self.quota_bytes:
+                break
+            if digest == keep:
+                continue
+            print(f"[Info] Evicting cached database of {entry.name} ({entry.size / 2**20:.0f}MB)")
+            shutil.rmtree(self.cache_dir / digest, ignore_errors=True)
+            del self.entries[digest]
+            total -= entry.size
+
+    def _load_manifest(self) -> dict[str, CacheEntry]:
+        manifest = self.cache_dir / MANIFEST_NAME
+        if not manifest.exists():
+            return {}
+        try:
+            with manifest.open() as f:
+                return {digest: CacheEntry(**entry) for digest, entry in json.load(f).items()}
+        except (ValueError, TypeError, AttributeError) as e:
+            # The databases are still on disk, but without their hashes they cannot be reused
+            print(f"[Warning] Ignoring corrupt database cache manifest {manifest}: {e}")
+            return {}
+
+    def _save_manifest(self):
+        manifest = self.cache_dir / MANIFEST_NAME
+        temp = manifest.with_suffix(".tmp")
+        with temp.open("w") as f:
+            json.dump({digest: asdict(entry) for digest, entry in self.entries.items()}, f, indent=4)
+        temp.replace(manifest)
@@ -0,0 +1,249 @@
+"""
+Watch mode for merge_vtable_and_classes: keep the merge state in memory and re-merge only what changed.
+
+Each class remembers the methods file it came from. When a methods file changes, only the classes whose methods
+changed and their descendants are re-merged. Prototypes declared by unaffected classes keep their indices, and
+re-merged classes reuse the indices of the prototypes they declared before.
+
+Limitations, until the next full merge (which also happens whenever classes.json changes):
+- Details a re-merged class contributed to its ancestors' prototypes (types, names) are kept.
+- Prototypes that are no longer declared stay in prototypes.json, unreferenced.
+"""
+
+import copy
+import json
+import time
+from collections.abc import Iterable
+from pathlib import Path
+
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    ClassNameToVtable,
+    CompactMethod,
+    EnhancedJSONEncoder,
+    InputMethod,
+    MethodPrototype,
+    collect_prototypes,
+    collect_prototypes_for_class,
+    dfs_classes,
+    fix_getters,
+    fix_pure_virtual_methods,
+    number_class_forest,
+    parse_methods_file,
+    write_text_atomic,
+)
+from symbol_sources import SymbolIndex, SymbolSource
+
+
+class IncrementalMerge:
+    def __init__(
+        self,
+        classes_file: Path,
+        methods_folder: Path,
+        symbol_sources: list[SymbolSource] | None = None,
+        classes_output: Path = CLASSES_OUTPUT,
+        prototypes_output: Path = PROTOTYPES_OUTPUT,
+    ):
+        self.classes_file = classes_file
+        self.methods_folder = methods_folder
+        self.symbol_sources = symbol_sources or []
+        self.classes_output = classes_output
+        self.prototypes_output = prototypes_output
+
+        self.classes: list[ClassInfo] = []
+        self.classes_dict: dict[str, ClassInfo] = {}
+        # Parsed input, kept as immutable tuples so it can be compared and reused across merges
+        self.file_methods: dict[Path, dict[str, list[CompactMethod]]] = {}
+        self.symbols = SymbolIndex()
+        self.input_methods: dict[str, list[CompactMethod]] = {}
+        self.class_source: dict[str, Path] = {}
+        # class name -> (methods of the input, enriched by the symbol sources), so only changed classes are enriched
+        self._enriched: dict[str, tuple[list[CompactMethod], list[CompactMethod]]] = {}
+        # Merge state, before the output fixes (`fix_pure_virtual_methods`, `fix_getters`) are applied
+        self.class_to_vtable: ClassNameToVtable = {}
+        self.prototypes: list[MethodPrototype] = []
+        # Serialized output of each class and prototype, see `write`
+        self._class_json: dict[str, str] = {}
+        self._prototype_json: list[str] = []
+
+    def full_merge(self):
+        """Reload all the input and merge it from scratch"""
+        with self.classes_file.open() as f:
+            classes = [ClassInfo.from_dict(cls) for cls in json.load(f)]
+        # In input order, which determines the order of the prototypes
+        self.classes_dict = {c.name: c for c in classes}
+        self.classes = number_class_forest(classes)
+
+        class_names = frozenset(self.classes_dict)
+        self.file_methods = {
+            path: dict(parse_methods_file(path, class_names)) for path in sorted(self.methods_folder.glob("*"))
+        }
+        self.symbols = SymbolIndex.build(self.symbol_sources, class_names)
+        self._enriched = {}
+        self.input_methods, self.class_source = self._effective_input()
+        self._class_json, self._prototype_json = {}, []
+
+        self.class_to_vtable, self.prototypes = collect_prototypes(
+            {name: _materialize(methods) for name, methods in self.input_methods.items()}, self.classes_dict
+        )
+        self.write()
+
+    def update_files(self, paths: Iterable[Path]) -> set[str]:
+        """Re-read the given methods files (dropping deleted ones) and re-merge the affected classes. Returns them."""
+        class_names = frozenset(self.classes_dict)
+        touched: set[str] = set()
+        for path in paths:
+            touched.update(self.file_methods.pop(path, {}))
+            if path.is_file():
+                self.file_methods[path] = dict(parse_methods_file(path, class_names))
+                touched.update(self.file_methods[path])
+
+        input_methods, self.class_source = self._effective_input()
+        changed = {name for name in touched if input_methods.get(name) != self.input_methods.get(name)}
+        self.input_methods = input_methods
+        if not changed:
+            return set()
+
+        dirty = self._with_descendants(changed)
+        modified_prototypes = self._referenced_prototypes(dirty)
+        self._remerge(dirty)
+        modified_prototypes.update(self._referenced_prototypes(dirty))
+        self.write(dirty, modified_prototypes)
+        return dirty
+
+    def write(self, class_names: Iterable[str] | None = None, prototype_indices: Iterable[int] | None = None):
+        """
+        Write the output files atomically.
+        Only the given classes and prototypes (all by default) are serialized again, the rest is reused from the
+        previous write.
+        """
+        for name in self.classes_dict if class_names is None else class_names:
+            clazz = self.classes_dict[name]
+            clazz.vtable = self.class_to_vtable.get(name) or None
+            self._class_json[name] = json.dumps(clazz, cls=EnhancedJSONEncoder)
+
+        # Fixes are applied on copies, so further merges will enrich the original prototypes like a full merge would
+        self._prototype_json.extend([""] * (len(self.prototypes) - len(self._prototype_json)))
+        prototypes = [copy.copy(self.prototypes[i]) for i in prototype_indices or range(len(self.prototypes))]
+        fix_pure_virtual_methods(prototypes)
+        fix_getters(prototypes)
+        for prototype in prototypes:
+            self._prototype_json[prototype.proto_index] = json.dumps(prototype, cls=EnhancedJSONEncoder)
+
+        # Same format as json.dumps of the whole list
+        write_text_atomic(self.classes_output, "[" + ", ".join(self._class_json[c.name] for c in self.classes) + "]")
+        write_text_atomic(self.prototypes_output, "[" + ", ".join(self._prototype_json) + "]")
+
+    def _referenced_prototypes(self, class_names: set[str]) -> set[int]:
+        """Prototypes in the vtables of the classes, which are the only ones merging the classes can modify"""
+        return {m.prototype_index for name in class_names for m in self.class_to_vtable.get(name, [])}
+
+    def _effective_input(self) -> tuple[dict[str, list[CompactMethod]], dict[str, Path]]:
+        """Apply the methods files in name order, then the symbol sources, like a full merge"""
+        input_methods: dict[str, list[CompactMethod]] = {}
+        class_source: dict[str, Path] = {}
+        for path in sorted(self.file_methods):
+            for class_name, methods in self.file_methods[path].items():
+                input_methods[class_name] = methods
+                class_source[class_name] = path
+
+        enriched_cache = {}
+        for class_name in self.symbols.slots.keys() & input_methods.keys():
+            methods = input_methods[class_name]
+            cached = self._enriched.get(class_name)
+            if cached is not None and cached[0] == methods:
+                enriched_cache[class_name] = cached
+            else:
+                enriched = _materialize(methods)
+                self.symbols.enrich(class_name, enriched)
+                enriched_cache[class_name] = (methods, [m.to_tuple() for m in enriched])
+            input_methods[class_name] = enriched_cache[class_name][1]
+        self._enriched = enriched_cache
+        for class_name in self.symbols.classes.keys() - input_methods.keys():
+            _, source, methods = self.symbols.classes[class_name]
+            input_methods[class_name] = methods
+            class_source[class_name] = source
+        return input_methods, class_source
+
+    def _with_descendants(self, class_names: set[str]) -> set[str]:
+        dirty: set[str] = set()
+        for name in class_names:
+            clazz = self.classes_dict[name]
+            assert clazz.pre_order is not None and clazz.subtree_end is not None
+            dirty.update(c.name for c in self.classes[clazz.pre_order : clazz.subtree_end])
+        return dirty
+
+    def _remerge(self, dirty: set[str]):
+        """Recollect the prototypes and vtables of the dirty classes, which must be closed under descendants"""
+        reuse_indices = {
+            (p.declaring_class, p.vtable_index): p.proto_index for p in self.prototypes if p.declaring_class in dirty
+        }
+        for name in dirty:
+            self.class_to_vtable.pop(name, None)
+
+        def handle_class(class_info: ClassInfo):
+            if class_info.name not in dirty or class_info.name not in self.input_methods:
+                return
+
+            class_vtable = collect_prototypes_for_class(
+                class_info,
+                _materialize(self.input_methods[class_info.name]),
+                self.prototypes,
+                self.class_to_vtable.get(class_info.parent or "", []),
+                reuse_indices,
+            )
+            if class_vtable is not None:
+                self.class_to_vtable[class_info.name] = class_vtable
+
+        dfs_classes(self.classes_dict, handle_class)
+
+
+def _materialize(methods: list[CompactMethod]) -> list[InputMethod]:
+    """Fresh InputMethod objects, as merging mutates them"""
+    return [InputMethod.from_tuple(m) for m in methods]
+
+
+def _snapshot(merge: IncrementalMerge) -> dict[Path, tuple[int, int]]:
+    """(mtime, size) of every input file"""
+    paths = [merge.classes_file, *merge.methods_folder.glob("*"), *(source.path for source in merge.symbol_sources)]
+    snapshot = {}
+    for path in paths:
+        try:
+            stat = path.stat()
+        except FileNotFoundError:
+            continue
+        snapshot[path] = (stat.st_mtime_ns, stat.st_size)
+    return snapshot
+
+
+def watch(merge: IncrementalMerge, poll_interval: float = 0.5):
+    """Merge, then poll the input files and re-merge on every change. Runs until interrupted."""
+    start = time.perf_counter()
+    merge.full_merge()
+    print(f"[Info] Merged {len(merge.classes)} classes in {time.perf_counter() - start:.2f}s, watching for changes")
+
+    snapshot = _snapshot(merge)
+    while True:
+        time.sleep(poll_interval)
+        current = _snapshot(merge)
+        changed = {path for path in snapshot.keys() | current.keys() if snapshot.get(path) != current.get(path)}
+        if not changed:
+            continue
+
+        start = time.perf_counter()
+        try:
+            if merge.classes_file in changed or any(source.path in changed for source in merge.symbol_sources):
+                merge.full_merge()
+                remerged = len(merge.classes)
+            else:
+                remerged = len(merge.update_files(changed))
+        except ValueError as e:
+            # Probably a file that is still being written. Keep the old snapshot so it is retried on the next poll.
+            print(f"[Warning] Failed to re-merge, will retry: {e}")
+            continue
+
+        snapshot = current
+        names = ", ".join(sorted(path.name for path in changed))
+        print(f"[Info] {names} changed: re-merged {remerged} classes in {time.perf_counter() - start:.2f}s")
@@ -1,9 +1,10 @@
-import dataclasses
 import json
+from collections.abc import Callable, Iterator, Mapping
 from dataclasses import dataclass
 from pathlib import Path
 
 from idahelper import cpp, memory, tif
+from methods_stream import DataclassJSONEncoder, class_depth
 
 PURE_VIRTUAL_FUNC_NAME = "cxa_pure_virtual"
 UNKNOWN_TYPE = "???"
@@ -94,13 +95,44 @@ def get_func_types(func_addr: int, demangled_name: str | None) -> tuple[str, lis
     return return_type, parameters
 
 
+type FuncTypes = tuple[str, list[MethodParam]]
+
+
+class FuncTypesCache:
+    """
+    Resolved types of functions, by address. Inherited slots point to the same function in every subclass's vtable,
+    so each function is typed once per database. The cached parameter lists are shared, do not modify them.
+    A disabled cache resolves the function on every lookup.
+    """
+
+    def __init__(self, resolve: Callable[[int, str | None], FuncTypes] = get_func_types, enabled: bool = True):
+        self.resolve = resolve
+        self.enabled = enabled
+        self.entries: dict[int, FuncTypes] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, func_ea: int, func_name: str) -> FuncTypes:
+        types = self.entries.get(func_ea)
+        if types is None:
+            self.misses += 1
+            types = self.resolve(func_ea, cpp.demangle(func_name))
+            if self.enabled:
+                self.entries[func_ea] = types
+        else:
+            self.hits += 1
+        return types
+
+
 def reset_imports_caching():
     """hack to fix ida-ios-helper caching of imports"""
     memory.imports.cache_clear()
 
 
-def extract_vtable(type_name: str, vtable_ea: int) -> list[Method] | None:
-    """Return list of virtual methods from vtable ea"""
+def extract_vtable(type_name: str, vtable_ea: int, func_types: FuncTypesCache | None = None) -> list[Method] | None:
+    """Return list of virtual methods from vtable ea. Function types are looked up in `func_types` if given."""
+    if func_types is None:
+        func_types = FuncTypesCache(enabled=False)
     methods: list[Method] = []
     try:
         for entry in cpp.iterate_vtable(vtable_ea, skip_reserved=True, raise_on_error=True):
@@ -110,7 +142,7 @@ def extract_vtable(type_name: str, vtable_ea: int) -> list[Method] | None:
             else:
                 class_name, method_name = class_and_name
 
-            return_type, parameters = get_func_types(entry.func_ea, cpp.demangle(entry.func_name))
+            return_type, parameters = func_types.get(entry.func_ea, entry.func_name)
 
             methods.append(
                 Method(
@@ -128,24 +160,42 @@ def extract_vtable(type_name: str, vtable_ea: int) -> list[Method] | None:
     return methods
 
 
+def iter_methods(parents: Mapping[str, str] | None = None) -> Iterator[tuple[str, list[Method]]]:
+    """
+    Yields pairs of class name and its methods, one class at a time.
+    Given the parents of the classes, yields parents before their subclasses, as delta streams need.
+    """
+    reset_imports_caching()
+    func_types = FuncTypesCache()
+    vtables = cpp.iterate_vtables()
+    if parents is not None:
+        vtables = sorted(vtables, key=lambda item: class_depth(item[0], parents))
+    for type_name, ea in vtables:
+        methods = extract_vtable(type_name, ea, func_types)
+        if methods:
+            yield type_name, methods
+    print(f"[Info] Function types cache: {func_types.hits} hits, {func_types.misses} misses")
+
+
+def get_parents() -> dict[str, str]:
+    """Returns a mapping of class name to its parent's name, for the classes having a parent."""
+    parents = {}
+    for cls, _ in cpp.get_all_cpp_classes():
+        parent = tif.get_parent_class(cls)
+        if parent is not None:
+            parents[cls.get_type_name()] = parent.get_type_name()
+    return parents
+
+
 def get_methods() -> dict[str, list[Method]]:
     """Returns a mapping of class name to list of methods."""
-    reset_imports_caching()
-    all_methods = {type_name: extract_vtable(type_name, ea) for type_name, ea in cpp.iterate_vtables()}
-    return {k: v for k, v in all_methods.items() if v}
+    return dict(iter_methods())
 
 
 def serialize(data, path: Path):
     """Write data as JSON to the given path, with support for serializing data classes"""
-
-    class EnhancedJSONEncoder(json.JSONEncoder):
-        def default(self, o):
-            if dataclasses.is_dataclass(o) and not isinstance(o, type):
-                return dataclasses.asdict(o)
-            return super().default(o)
-
     with path.open("w") as f:
-        json.dump(data, f, indent=4, cls=EnhancedJSONEncoder)
+        json.dump(data, f, indent=4, cls=DataclassJSONEncoder)
 
 
 def main():
@@ -1,7 +1,15 @@
+import argparse
 import contextlib
+import functools
 import os
+import shutil
 import struct
 import sys
+import tempfile
+import time
+from collections.abc import Callable
+from contextlib import AbstractContextManager
+from dataclasses import dataclass
 from pathlib import Path
 
 from tqdm import tqdm
@@ -11,7 +19,12 @@ try:
 except ModuleNotFoundError:
     import idapro as ida
 
-from kdk_extract_vtable import get_methods, serialize
+from extraction_history import HISTORY_FILE, ExtractionHistory
+from file_supervisor import STATUS_OK, Supervisor
+from idb_cache import IdbCache, file_hash
+from kdk_extract_vtable import get_parents, iter_methods
+from methods_stream import STREAM_SUFFIX, write_methods_stream
+from prefetch import DEFAULT_DEPTH, Prefetcher
 
 OUT_FOLDER = Path("out")
 
@@ -79,56 +92,71 @@ def is_fat(path: Path) -> bool:
 
 
 def get_all_kexts(kdk_folder: Path) -> list[Path]:
-    return [binary for binary in kdk_folder.glob("**") if not binary.name.endswith(".thin") and is_kext(binary)]
+    # Before Python 3.13, "**" only matches directories
+    return [binary for binary in kdk_folder.rglob("*") if not binary.name.endswith(".thin") and is_kext(binary)]
 
 
 def thin_binary(binary: Path) -> Path:
     # Until IDA will support passing params to idalib open
     if not is_fat(binary):
         return binary
-    new_binary = binary.with_name(binary.name + ".thin")
+    new_binary = thinned_path(binary)
     if new_binary.exists() or not os.system(f"lipo {binary} -thin arm64e -output {new_binary}"):
         return new_binary
     return binary
 
 
-def main(argv):
-    if len(argv) != 2:
-        print("Usage: kdk_mass_extract_vtable.py <kdk_folder> path_to_kernel_development")
-        return
+def thinned_path(binary: Path) -> Path:
+    return binary.with_name(binary.name + ".thin")
 
-    kdk_folder, path_to_kernel = Path(argv[0]), Path(argv[1])
-    kexts = get_all_kexts(kdk_folder)
-    files = [path_to_kernel, *kexts]
-    files = [thin_binary(f) for f in files]
 
-    OUT_FOLDER.mkdir(exist_ok=True)
+@dataclass
+class PreparedFile:
+    binary: Path
+    # The binary to analyze, thinned if it was fat
+    thinned: Path
+    # The path to open: the thinned binary or its copy in scratch storage
+    path: Path
+    digest: str | None = None
+    staged_dir: Path | None = None
+    # Why the file could not be prepared, in which case it is not analyzed
+    error: str | None = None
 
-    for i, file in (pbar := tqdm(enumerate(files), total=len(files))):
-        pbar.set_description(file.name)
-        open_and_process_file(file, i, len(files))
 
+def prepare_file(binary: Path, scratch: Path | None = None, hash_binary: bool = False) -> PreparedFile:
+    """
+    Thin the binary, copy it to scratch storage and hash it, ahead of its analysis.
+    Failures are returned in `error` instead of raised, so they only skip this file.
+    """
+    staged_dir = None
+    try:
+        thinned = thin_binary(binary)
+        path = thinned
+        if scratch is not None:
+            staged_dir = Path(tempfile.mkdtemp(prefix="stage-", dir=scratch))
+            path = staged_dir / thinned.name
+            shutil.copyfile(thinned, path)
+        return PreparedFile(binary, thinned, path, file_hash(path) if hash_binary else None, staged_dir)
+    except Exception as e:
+        if staged_dir is not None:
+            shutil.rmtree(staged_dir, ignore_errors=True)
+        return PreparedFile(binary, binary, binary, error=repr(e))
 
-def open_and_process_file(file_path: Path, index, total):
-    with ida_open(file_path), open("logs.txt", "a") as f, redirect_stdout(f):
-        print(f"[Status] {index}/{total}: Processing {file_path.name}")
-        try:
-            process_file(file_path)
-        except Exception as e:
-            print(f"Failed to process {file_path}: {e}")
 
+def cleanup_file(prepared: PreparedFile):
+    """Remove the staged copy of the binary, with the database IDA created next to it"""
+    if prepared.staged_dir is not None:
+        shutil.rmtree(prepared.staged_dir, ignore_errors=True)
 
-def process_file(file_path: Path):
-    methods = get_methods()
-    serialize(methods, Path("out") / (file_path.name + ".json"))
-    print(f"[Info] Serialized {len(methods)} classes")
 
+class IdaBackend:
+    """Open databases with idalib"""
 
-@contextlib.contextmanager
-def redirect_stdout(stream):
-    sys.stdout = stream
-    yield
-    sys.stdout = sys.__stdout__
+    def open(self, path: Path, run_auto_analysis: bool):
+        ida.open_database(str(path), run_auto_analysis)
+
+    def close(self, save: bool):
+        ida.close_database(save)
 
 
 @contextlib.contextmanager
@@ -140,5 +168,141 @@ def ida_open(file_path: Path):
         ida.close_database()
 
 
+def main(argv):
+    parser = argparse.ArgumentParser(prog="kdk_mass_extract_vtable.py")
+    parser.add_argument("kdk_folder", type=Path)
+    parser.add_argument("path_to_kernel", type=Path, help="path to kernel development")
+    parser.add_argument("--idb-cache", type=Path, help="keep analyzed databases in this folder and reuse them")
+    parser.add_argument("--cache-quota", type=float, help="maximal size of the database cache, in GB")
+    parser.add_argument("--timeout", type=float, help="process each file in a child process, killed after SECONDS")
+    parser.add_argument("--max-rss", type=float, help="process each file in a child process, killed above GB of RSS")
+    parser.add_argument("--report", type=Path, default=Path("report.json"), help="report of skipped and slow files")
+    parser.add_argument("--slow-threshold", type=float, default=600, help="files slower than this (seconds) are slow")
+    parser.add_argument("--history", type=Path, default=HISTORY_FILE, help="per-file durations of previous runs")
+    parser.add_argument(
+        "--delta", action="store_true", help="write vtables relative to the parent (see methods_stream.py)"
+    )
+    parser.add_argument("--scratch", type=Path, help="analyze copies of the binaries staged in this (fast) folder")
+    parser.add_argument("--prefetch", type=int, default=DEFAULT_DEPTH, help="number of files prepared ahead")
+    options = parser.parse_args(argv)
+
+    # Only the cheap header check is done upfront, so only kexts are scheduled and counted in the progress
+    kexts = get_all_kexts(options.kdk_folder)
+    files = [options.path_to_kernel, *kexts]
+
+    # Longest first, so a long file does not end up last. Durations are recorded for the thinned binaries.
+    history = ExtractionHistory(options.history)
+    files = history.schedule(files, history_path)
+    predictions = [history.predict(history_path(f)) for f in files]
+
+    OUT_FOLDER.mkdir(exist_ok=True)
+
+    quota = int(options.cache_quota * 2**30) if options.cache_quota else None
+    cache = IdbCache(options.idb_cache, IdaBackend(), quota) if options.idb_cache else None
+    if options.scratch:
+        options.scratch.mkdir(parents=True, exist_ok=True)
+    # The database cache is keyed by the hash of the binary
+    prepare = functools.partial(prepare_file, scratch=options.scratch, hash_binary=options.idb_cache is not None)
+    prefetcher = Prefetcher(files, prepare, cleanup_file, depth=max(options.prefetch, 1))
+
+    supervisor = None
+    if options.timeout or options.max_rss:
+        max_rss = int(options.max_rss * 2**30) if options.max_rss else None
+        supervisor = Supervisor(extract_in_worker, options.timeout, max_rss)
+
+    # Progress is measured in predicted seconds, so the ETA accounts for the size of the remaining files
+    bar_format = "{l_bar}{bar}| {n:.0f}/{total:.0f}s predicted{postfix} [{elapsed}<{remaining}]"
+    with (
+        tqdm(total=sum(predictions), bar_format=bar_format) as pbar,
+        contextlib.closing(iter(prefetcher)) as prepared_files,
+    ):
+        for i, (prepared, predicted) in enumerate(zip(prepared_files, predictions, strict=True)):
+            pbar.set_description(prepared.binary.name)
+            pbar.set_postfix_str(f"{i}/{len(files)} files")
+            if prepared.error is not None:
+                report_prepare_failure(prepared, supervisor)
+                pbar.update(predicted)
+                continue
+
+            start = time.monotonic()
+            if supervisor is not None:
+                supervisor.run(prepared.path, i, len(files), options.idb_cache, quota, options.delta, prepared.digest)
+            else:
+                opener = functools.partial(cache.open, digest=prepared.digest) if cache is not None else ida_open
+                open_and_process_file(prepared.path, i, len(files), opener, options.delta)
+
+            history.record(prepared.thinned, time.monotonic() - start)
+            history.save()
+            pbar.update(predicted)
+
+    if supervisor is not None:
+        supervisor.write_report(options.report, options.slow_threshold)
+        skipped = sum(result.status != STATUS_OK for result in supervisor.results)
+        print(f"Skipped {skipped} files, see {options.report}")
+    elif cache is not None:
+        print(f"Database cache: {cache.hits} hits, {cache.misses} misses")
+
+
+def report_prepare_failure(prepared: PreparedFile, supervisor: Supervisor | None):
+    """Record a file that could not be prepared like a failed extraction"""
+    assert prepared.error is not None
+    if supervisor is not None:
+        supervisor.record_failure(prepared.binary, prepared.error)
+    else:
+        print(f"[Warning] {prepared.binary.name}: failed to prepare: {prepared.error}")
+
+
+def history_path(binary: Path) -> Path:
+    """The path durations of the binary are recorded for: its thinned binary, once it exists"""
+    thinned = thinned_path(binary)
+    return thinned if thinned.exists() else binary
+
+
+def extract_in_worker(
+    file_path: Path,
+    index: int,
+    total: int,
+    idb_cache: Path | None,
+    cache_quota: int | None,
+    delta: bool = False,
+    digest: str | None = None,
+):
+    """Entry point of a supervised child process"""
+    # The cache is recreated in the child, so it sees the manifest as written by the previous workers
+    opener = ida_open
+    if idb_cache:
+        opener = functools.partial(IdbCache(idb_cache, IdaBackend(), cache_quota).open, digest=digest)
+    open_and_process_file(file_path, index, total, opener, delta)
+
+
+def open_and_process_file(
+    file_path: Path,
+    index,
+    total,
+    opener: Callable[[Path], AbstractContextManager[None]] = ida_open,
+    delta: bool = False,
+):
+    with opener(file_path), open("logs.txt", "a") as f, redirect_stdout(f):
+        print(f"[Status] {index}/{total}: Processing {file_path.name}")
+        try:
+            process_file(file_path, delta)
+        except Exception as e:
+            print(f"Failed to process {file_path}: {e}")
+
+
+def process_file(file_path: Path, delta: bool = False):
+    # Streamed, so a crash keeps the classes extracted so far
+    parents = get_parents() if delta else None
+    count = write_methods_stream(iter_methods(parents), OUT_FOLDER / (file_path.name + STREAM_SUFFIX), parents)
+    print(f"[Info] Serialized {count} classes")
+
+
+@contextlib.contextmanager
+def redirect_stdout(stream):
+    sys.stdout = stream
+    yield
+    sys.stdout = sys.__stdout__
+
+
 if __name__ == "__main__":
     main(sys.argv[1:])
@@ -1,14 +1,24 @@
 import abc
+import argparse
 import dataclasses
 import json
+import os
 import sys
+import tempfile
+from collections import Counter, defaultdict
 from collections.abc import Callable
+from concurrent.futures import ProcessPoolExecutor
 from dataclasses import dataclass
 from pathlib import Path
 
+from methods_stream import STREAM_SUFFIX, load_methods_file, read_vtables
+
 UNKNOWN = "???"
 FUNC_PREFIX_UNKNOWN = "sub_"
 
+CLASSES_OUTPUT = Path("../src/classes.json")
+PROTOTYPES_OUTPUT = Path("../src/prototypes.json")
+
 
 # Region json encoding
 class CustomToJson(abc.ABC):
@@ -19,7 +29,8 @@ class CustomToJson(abc.ABC):
 
 class EnhancedJSONEncoder(json.JSONEncoder):
     def default(self, o):
-        if isinstance(o, CustomToJson):
+        # Not isinstance: when this script runs as __main__, modules importing it get a second copy of its classes
+        if callable(getattr(o, "to_json", None)):
             return o.to_json()
         elif dataclasses.is_dataclass(o):
             return {EnhancedJSONEncoder.camelcase(k): v for k, v in EnhancedJSONEncoder.asdict_shallow(o).items()}
@@ -87,6 +98,25 @@ class InputMethod:
             parameters=[MethodParam.from_dict(p) for p in data["parameters"]],
         )
 
+    def to_tuple(self) -> "CompactMethod":
+        return (
+            self.name,
+            self.mangled_name,
+            self.return_type,
+            tuple((p.type, p.name) for p in self.parameters),
+            self.is_pure_virtual,
+            self.is_implemented_by_current_class,
+            self.vtable_index,
+        )
+
+    @classmethod
+    def from_tuple(cls, data: "CompactMethod") -> "InputMethod":
+        name, mangled_name, return_type, parameters, *rest = data
+        return cls(name, mangled_name, return_type, [MethodParam(*p) for p in parameters], *rest)
+
+
+# An already validated InputMethod, in a form that is cheap to pass between processes
+type CompactMethod = tuple[str, str, str, tuple[tuple[str, str | None], ...], bool, bool, int]
 
 # endregion
 
@@ -102,6 +132,10 @@ class MethodWithPrototype(CustomToJson):
     def to_json(self) -> object:
         return [self.prototype_index, self.is_overridden, self.is_pure_virtual, self.mangled_name]
 
+    @classmethod
+    def from_json(cls, data: list) -> "MethodWithPrototype":
+        return cls(*data)
+
 
 @dataclass
 class MethodPrototype:
@@ -113,6 +147,18 @@ class MethodPrototype:
     declaring_class: str
     proto_index: int
 
+    @classmethod
+    def from_dict(cls, data: dict) -> "MethodPrototype":
+        return cls(
+            name=data["name"],
+            mangled_name=data["mangledName"],
+            return_type=data["returnType"],
+            parameters=[MethodParam.from_dict(p) for p in data["parameters"]],
+            vtable_index=data["vtableIndex"],
+            declaring_class=data["declaringClass"],
+            proto_index=data["protoIndex"],
+        )
+
 
 @dataclass
 class ClassInfo:
@@ -120,6 +166,11 @@ class ClassInfo:
     parent: str | None
     is_abstract: bool
     vtable: list[MethodWithPrototype] | None = None
+    # Position in a pre-order DFS of the class forest. See `number_class_forest`.
+    pre_order: int | None = None
+    subtree_end: int | None = None
+    depth: int | None = None
+    ancestors: list[int] | None = None
 
     @classmethod
     def from_dict(cls, data: dict) -> "ClassInfo":
@@ -129,6 +180,19 @@ class ClassInfo:
             is_abstract=data["is_abstract"],
         )
 
+    @classmethod
+    def from_output_dict(cls, data: dict) -> "ClassInfo":
+        return cls(
+            name=data["name"],
+            parent=data.get("parent"),
+            is_abstract=data["isAbstract"],
+            vtable=[MethodWithPrototype.from_json(m) for m in data["vtable"]] if data.get("vtable") else None,
+            pre_order=data.get("preOrder"),
+            subtree_end=data.get("subtreeEnd"),
+            depth=data.get("depth"),
+            ancestors=data.get("ancestors"),
+        )
+
     def __hash__(self):
         return hash(self.name)
 
@@ -142,45 +206,266 @@ type ClassNameToVtable = dict[str, list[MethodWithPrototype]]
 
 
 def main(args):
-    if len(args) not in (2, 3):
-        print("Usage: merge_vtable_and_classes.py classes.json folder_of_methods_json [16_5_methods.json]")
+    parser = argparse.ArgumentParser(prog="merge_vtable_and_classes.py")
+    parser.add_argument("classes_file", help="classes.json from collect_classes.py")
+    parser.add_argument("methods_folder", help="folder of methods files from kdk_mass_extract_vtable.py")
+    parser.add_argument("extra_symbols_file", nargs="?", help="methods json of a symbolicated kernel (16.5)")
+    parser.add_argument(
+        "--symbols",
+        action="append",
+        default=[],
+        metavar="FILE[:PRIORITY]",
+        help="methods file of another release to fill unknown names and types from, higher priority wins (default 0)",
+    )
+    parser.add_argument("--provenance", type=Path, help="write which symbols file filled each slot to this file")
+    parser.add_argument("--index", type=Path, help="also build a query index (see query_index.py) at this path")
+    parser.add_argument("--search-index", type=Path, help="also write a search index (see search_index.py)")
+    parser.add_argument("--bundle", type=Path, help="also write a sharded bundle (see output_bundle.py) to this folder")
+    parser.add_argument("--artifacts", type=Path, help="also write hashed, compressed copies (see hashed_artifacts.py)")
+    parser.add_argument("--validate", action="store_true", help="check the output (see vtable_validator.py)")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="number of processes parsing the methods files")
+    parser.add_argument("--watch", action="store_true", help="keep running and re-merge on changes to the input")
+    options = parser.parse_args(args)
+    if options.watch:
+        # Watch mode only rewrites classes.json and prototypes.json
+        unsupported = [
+            flag
+            for flag, value in (
+                ("--provenance", options.provenance),
+                ("--index", options.index),
+                ("--search-index", options.search_index),
+                ("--bundle", options.bundle),
+                ("--artifacts", options.artifacts),
+                ("--validate", options.validate),
+                ("--jobs", options.jobs != 1),
+            )
+            if value
+        ]
+        if unsupported:
+            parser.error(f"--watch does not support {', '.join(unsupported)}")
+
+    from symbol_sources import SymbolIndex, SymbolSource
+
+    symbol_sources = [SymbolSource.parse(spec) for spec in options.symbols]
+    if options.extra_symbols_file:
+        symbol_sources.insert(0, SymbolSource(Path(options.extra_symbols_file)))
+
+    if options.watch:
+        from incremental_merge import IncrementalMerge, watch
+
+        watch(IncrementalMerge(Path(options.classes_file), Path(options.methods_folder), symbol_sources))
         return
-    classes_file_name = args[0]
-    folder_of_methods = args[1]
-    extra_symbols_file = args[2] if len(args) == 3 else None
 
     # Load classes from the provided JSON file
-    with open(classes_file_name) as f:
+    with open(options.classes_file) as f:
         classes = [ClassInfo.from_dict(cls) for cls in json.load(f)]
     classes_dict = {c.name: c for c in classes}
 
-    # Load input methods from the provided folder
+    input_methods = load_input_methods(Path(options.methods_folder), frozenset(classes_dict), options.jobs)
+    provenance = None
+    if symbol_sources:
+        provenance = SymbolIndex.build(symbol_sources, frozenset(classes_dict)).apply(input_methods)
+        filled = Counter(source for slots in provenance.values() for source in slots.values())
+        print(f"[Info] Symbols filled {filled.total()} slots: " + ", ".join(f"{s}: {n}" for s, n in filled.items()))
+
+    classes, prototypes = merge_vtables(classes, input_methods)
+
+    # Before anything is written, so an invalid merge leaves the published outputs as they were
+    if options.validate and not validate_output(classes, prototypes):
+        sys.exit(1)
+
+    if provenance is not None and options.provenance:
+        write_json_atomic(options.provenance, provenance)
+    # Serialize the results to JSON files
+    write_json_atomic(CLASSES_OUTPUT, classes)
+    write_json_atomic(PROTOTYPES_OUTPUT, prototypes)
+
+    write_extra_outputs(options, classes, prototypes)
+
+
+def write_extra_outputs(options: argparse.Namespace, classes: list[ClassInfo], prototypes: list[MethodPrototype]):
+    """Write the optional outputs requested on the command line"""
+    if options.index:
+        from query_index import build_index
+
+        build_index(options.index, classes, prototypes)
+    if options.search_index:
+        from search_index import write_search_index
+
+        write_search_index(options.search_index, classes, prototypes)
+    if options.bundle:
+        from output_bundle import write_bundle
+
+        write_bundle(options.bundle, classes, prototypes)
+    if options.artifacts:
+        from hashed_artifacts import print_report, write_artifacts
+
+        outputs = {path.name: path.read_bytes() for path in (CLASSES_OUTPUT, PROTOTYPES_OUTPUT)}
+        print_report(options.artifacts, write_artifacts(options.artifacts, outputs))
+
+
+def validate_output(classes: list[ClassInfo], prototypes: list[MethodPrototype]) -> bool:
+    """Check the merge output (see vtable_validator.py), printing the report. Returns whether it is valid."""
+    from vtable_validator import flatten, format_report, validate
+
+    violations = validate(flatten(classes, prototypes))
+    for line in format_report(violations, len(classes)):
+        print(line)
+    return not violations
+
+
+def write_json_atomic(path: Path, data: object, separators: tuple[str, str] | None = None):
+    # dumps, unlike dump, uses the C encoder
+    write_text_atomic(path, json.dumps(data, cls=EnhancedJSONEncoder, separators=separators))
+
+
+def write_text_atomic(path: Path, text: str):
+    """Write to a temporary file and rename it over `path`, so readers never observe a partial file."""
+    with tempfile.NamedTemporaryFile("w", dir=path.parent, prefix=path.name, suffix=".tmp", delete=False) as f:
+        try:
+            f.write(text)
+        except BaseException:
+            f.close()
+            os.unlink(f.name)
+            raise
+    os.chmod(f.name, 0o644)
+    os.replace(f.name, path)
+
+
+def load_input_methods(folder: Path, class_names: frozenset[str], jobs: int = 1) -> dict[str, list[InputMethod]]:
+    """
+    Load the methods of the known classes from all the methods files in the folder, parsing them in `jobs` processes.
+    Files are applied in name order, so a class found in multiple files gets its methods from the last one,
+    regardless of the number of processes.
+    """
+    files = sorted(folder.glob("*"))
     input_methods: dict[str, list[InputMethod]] = {}  # class_name -> vtable methods
-    for methods_file_name in Path(folder_of_methods).glob("*"):
-        with methods_file_name.open("r") as f:
-            input_methods.update(
-                {
-                    class_name: [InputMethod.from_dict(m) for m in list_methods]
-                    for class_name, list_methods in json.load(f).items()
-                    if class_name in classes_dict
-                }
-            )
-    if extra_symbols_file:
-        with open(extra_symbols_file) as f:
-            for class_name, methods in json.load(f).items():
-                if class_name not in input_methods and not class_name.endswith("::MetaClass"):
-                    input_methods[class_name] = [InputMethod.from_dict(m) for m in methods]
-
-    # Merge vtables
-    new_methods, prototypes = collect_prototypes(input_methods, classes_dict)
+
+    def add(parsed: list[tuple[str, list[CompactMethod]]]):
+        for class_name, methods in parsed:
+            input_methods[class_name] = [InputMethod.from_tuple(m) for m in methods]
+
+    if jobs <= 1:
+        for methods_file in files:
+            add(parse_methods_file(methods_file, class_names))
+    else:
+        with ProcessPoolExecutor(jobs, initializer=_init_parse_worker, initargs=(class_names,)) as pool:
+            for parsed in pool.map(_parse_methods_file_in_worker, files):
+                add(parsed)
+    return input_methods
+
+
+def parse_methods_file(path: Path, class_names: frozenset[str]) -> list[tuple[str, list[CompactMethod]]]:
+    """Parse a methods file (methods.json or a stream, see methods_stream.py), keeping only the known classes"""
+    if path.suffix == STREAM_SUFFIX:
+        # Parents of known classes may be unknown, so every delta of the stream is expanded
+        vtables = dict(read_vtables(path, _parse_method, _inherited))
+        return [(class_name, methods) for class_name, methods in vtables.items() if class_name in class_names]
+    return [
+        (class_name, [_parse_method(m) for m in list_methods])
+        for class_name, list_methods in load_methods_file(path).items()
+        if class_name in class_names
+    ]
+
+
+def _parse_method(data: dict) -> CompactMethod:
+    return InputMethod.from_dict(data).to_tuple()
+
+
+def _inherited(method: CompactMethod) -> CompactMethod:
+    return (*method[:5], False, method[6])
+
+
+_worker_class_names: frozenset[str] = frozenset()
+
+
+def _init_parse_worker(class_names: frozenset[str]):
+    global _worker_class_names
+    _worker_class_names = class_names
+
+
+def _parse_methods_file_in_worker(path: Path) -> list[tuple[str, list[CompactMethod]]]:
+    return parse_methods_file(path, _worker_class_names)
+
+
+def read_merged_output(
+    classes_path: str | Path = CLASSES_OUTPUT, prototypes_path: str | Path = PROTOTYPES_OUTPUT
+) -> tuple[list[ClassInfo], list[MethodPrototype]]:
+    """Load the output of a previous merge back into the merge data model."""
+    with open(classes_path) as f:
+        classes = [ClassInfo.from_output_dict(cls) for cls in json.load(f)]
+    with open(prototypes_path) as f:
+        prototypes = [MethodPrototype.from_dict(proto) for proto in json.load(f)]
+    # Output of older merges is not numbered
+    if any(cls.pre_order is None for cls in classes):
+        classes = number_class_forest(classes)
+    return classes, prototypes
+
+
+def merge_vtables(
+    classes: list[ClassInfo], input_methods: dict[str, list[InputMethod]]
+) -> tuple[list[ClassInfo], list[MethodPrototype]]:
+    """
+    Merge the vtables of the classes into shared prototypes. Writes the vtable of each class in place.
+    Returns the classes in hierarchy order (see `number_class_forest`) and the prototypes.
+    """
+    new_methods, prototypes = collect_prototypes(input_methods, {c.name: c for c in classes})
+    fix_pure_virtual_methods(prototypes)
     fix_getters(prototypes)
     write_vtables_to_classes(classes, new_methods)
+    return number_class_forest(classes), prototypes
 
-    # Serialize the results to JSON files
-    with open("../src/classes.json", "w") as f:
-        json.dump(classes, f, cls=EnhancedJSONEncoder)
-    with open("../src/prototypes.json", "w") as f:
-        json.dump(prototypes, f, cls=EnhancedJSONEncoder)
+
+def number_class_forest(classes: list[ClassInfo]) -> list[ClassInfo]:
+    """
+    Number the classes in a pre-order DFS of the class forest, and return them in that order.
+    Each class gets its pre-order index, the (exclusive) end of its subtree, its depth and the pre-order indices
+    of its ancestors (root first), so the descendants of `c` are exactly `ordered[c.pre_order + 1 : c.subtree_end]`.
+    Classes in a parent cycle are unreachable from any root: the first of each cycle becomes a root itself.
+    """
+    classes_dict = {c.name: c for c in classes}
+    children: dict[str, list[ClassInfo]] = defaultdict(list)
+    roots: list[ClassInfo] = []
+    for clazz in classes:
+        if clazz.parent in classes_dict:
+            children[clazz.parent].append(clazz)
+        else:
+            roots.append(clazz)
+
+    ordered: list[ClassInfo] = []
+    visited: set[str] = set()
+
+    def visit(root: ClassInfo):
+        ancestors: list[int] = []
+        # (class, is_leaving) pairs. Iterative, as the hierarchy might be deeper than the recursion limit.
+        stack: list[tuple[ClassInfo, bool]] = [(root, False)]
+        while stack:
+            clazz, is_leaving = stack.pop()
+            if is_leaving:
+                clazz.subtree_end = len(ordered)
+                ancestors.pop()
+                continue
+            if clazz.name in visited:
+                # Back to the start of a cycle
+                continue
+
+            visited.add(clazz.name)
+            clazz.pre_order = len(ordered)
+            clazz.depth = len(ancestors)
+            clazz.ancestors = ancestors.copy()
+            ordered.append(clazz)
+
+            ancestors.append(clazz.pre_order)
+            stack.append((clazz, True))
+            stack.extend((child, False) for child in reversed(children[clazz.name]))
+
+    for root in roots:
+        visit(root)
+    for clazz in classes:
+        if clazz.name not in visited:
+            print(f"[Warning] {clazz.name} is in a parent cycle, numbered as a root")
+            visit(clazz)
+    return ordered
 
 
 def write_vtables_to_classes(classes: list[ClassInfo], methods: ClassNameToVtable):
@@ -218,8 +503,6 @@ def collect_prototypes(
             class_to_vtable[class_info.name] = class_vtable
 
     dfs_classes(classes, handle_class)
-
-    fix_pure_virtual_methods(prototypes)
     return class_to_vtable, prototypes
 
 
@@ -259,7 +542,12 @@ def collect_prototypes_for_class(
     methods: list[InputMethod],
     prototypes: list[MethodPrototype],
     parent_vtable: list[MethodWithPrototype],
+    reuse_indices: dict[tuple[str, int], int] | None = None,
 ) -> list[MethodWithPrototype] | None:
+    """
+    Build the vtable of the class on top of its parent's vtable, enriching inherited prototypes and adding new ones.
+    New prototypes are appended, unless `reuse_indices` maps their (declaring class, vtable index) to an existing index.
+    """
     class_name = class_info.name
     my_methods: list[MethodWithPrototype] = []
 
@@ -287,6 +575,7 @@ def collect_prototypes_for_class(
     # Add new methods' prototypes
     for i in range(len(parent_vtable), len(methods)):
         input_method = methods[i]
+        proto_index = (reuse_indices or {}).get((class_name, input_method.vtable_index), len(prototypes))
         if input_method.is_pure_virtual:
             prototype = MethodPrototype(
                 name="",
@@ -295,7 +584,7 @@ def collect_prototypes_for_class(
                 parameters=[MethodParam(type=UNKNOWN)],
                 vtable_index=input_method.vtable_index,
                 declaring_class=class_name,
-                proto_index=len(prototypes),
+                proto_index=proto_index,
             )
         else:
             prototype = MethodPrototype(
@@ -305,9 +594,12 @@ def collect_prototypes_for_class(
                 parameters=input_method.parameters,
                 vtable_index=input_method.vtable_index,
                 declaring_class=class_name,
-                proto_index=len(prototypes),
+                proto_index=proto_index,
             )
-        prototypes.append(prototype)
+        if proto_index == len(prototypes):
+            prototypes.append(prototype)
+        else:
+            prototypes[proto_index] = prototype
         my_methods.append(
             MethodWithPrototype(
                 prototype.proto_index,
@@ -354,10 +646,10 @@ def enrich_parameters(class_name: str, prototype: MethodPrototype, input_method:
     """Enrich the parameters of the prototype with the input method's parameters."""
 
     # If we have unknown parameters, we can use the input method's parameters to fill them.
-    if _has_unknown_parameters(prototype.parameters):
+    if has_unknown_parameters(prototype.parameters):
         prototype.parameters = input_method.parameters
     # Otherwise, try to enrich the parameters themselves.
-    if not _has_unknown_parameters(input_method.parameters):
+    if not has_unknown_parameters(input_method.parameters):
         if len(prototype.parameters) != len(input_method.parameters):
             print(f"[Error] Parameters count mismatch on {class_name}: \n\t{prototype}\n\t{input_method}")
             # If the method does not depend on the parameters, IDA might consider it a method without parameters.
@@ -373,7 +665,7 @@ def enrich_parameters(class_name: str, prototype: MethodPrototype, input_method:
                 proto_param.name = proto_param.name
 
 
-def _has_unknown_parameters(parameters: list[MethodParam]) -> bool:
+def has_unknown_parameters(parameters: list[MethodParam]) -> bool:
     """Does this prototype have unknown parameters?"""
     return len(parameters) == 1 and parameters[0].type == UNKNOWN
 
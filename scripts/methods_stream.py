@@ -0,0 +1,139 @@
+"""
+Streamed methods files: JSON lines of {"class": <class name>, "methods": [<method>, ...]}, one line per class.
+
+Classes are written as soon as they are extracted, so memory stays bounded by a single class and a crash keeps the
+classes written so far. `to-json` converts a stream to the methods.json format (class name -> methods).
+
+Delta streams store a class whose parent was written earlier in the file relative to the parent's vtable:
+{"class": <class name>, "parent": <parent name>, "length": <vtable length>, "slots": [<slot>, ...], "methods": [...]}
+Only the overridden and added slots are written; the other slots are the parent's method, not implemented by the class.
+Writing a delta stream, and reading any stream, keeps the vtables of the file in memory.
+
+Usage: methods_stream.py to-json methods.jsonl methods.json
+"""
+
+import dataclasses
+import json
+import sys
+from collections.abc import Callable, Iterable, Iterator, Mapping
+from pathlib import Path
+
+STREAM_SUFFIX = ".jsonl"
+
+
+class DataclassJSONEncoder(json.JSONEncoder):
+    def default(self, o):
+        if dataclasses.is_dataclass(o) and not isinstance(o, type):
+            return dataclasses.asdict(o)
+        return super().default(o)
+
+
+def write_methods_stream(
+    items: Iterable[tuple[str, list]], path: Path, parents: Mapping[str, str] | None = None
+) -> int:
+    """
+    Write each (class name, methods) pair as a line, flushing as it goes. Returns the number of classes written.
+    If `parents` (class name -> parent name) is given, writes a delta stream.
+    """
+    written: dict[str, list[dict]] = {}
+    count = 0
+    with path.open("w") as f:
+        for class_name, methods in items:
+            entry = {"class": class_name, "methods": methods}
+            if parents is not None:
+                vtable = written[class_name] = [_as_dict(m) for m in methods]
+                if (parent := parents.get(class_name)) in written:
+                    entry = delta_entry(class_name, parent, vtable, written[parent])
+            f.write(json.dumps(entry, cls=DataclassJSONEncoder) + "\n")
+            f.flush()
+            count += 1
+    return count
+
+
+def delta_entry(class_name: str, parent: str, vtable: list[dict], parent_vtable: list[dict]) -> dict:
+    """The delta line of a class: the slots that are not an inherited method of the parent"""
+    slots = [
+        slot
+        for slot, method in enumerate(vtable)
+        if slot >= len(parent_vtable) or method != inherited(parent_vtable[slot])
+    ]
+    return {
+        "class": class_name,
+        "parent": parent,
+        "length": len(vtable),
+        "slots": slots,
+        "methods": [vtable[slot] for slot in slots],
+    }
+
+
+def inherited(method: dict) -> dict:
+    """The method as it appears in the vtable of a subclass not overriding it"""
+    return {**method, "is_implemented_by_current_class": False}
+
+
+def class_depth(class_name: str, parents: Mapping[str, str]) -> int:
+    """Number of ancestors of the class. Sorting by it puts parents before their subclasses."""
+    depth = 0
+    while (class_name := parents.get(class_name)) is not None:
+        depth += 1
+    return depth
+
+
+def _as_dict(method) -> dict:
+    return dataclasses.asdict(method) if dataclasses.is_dataclass(method) else method
+
+
+def read_stream_entries(path: Path) -> Iterator[dict]:
+    """Read the raw lines of a stream. A truncated last line, left by a crashed extraction, is skipped."""
+    with path.open() as f:
+        for line in f:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                if not line.endswith("\n"):
+                    print(f"[Warning] Skipping truncated last line of {path}")
+                    return
+                raise
+            yield entry
+
+
+def read_vtables[T](path: Path, parse: Callable[[dict], T], inherit: Callable[[T], T]) -> Iterator[tuple[str, list[T]]]:
+    """
+    Read (class name, vtable) pairs, with every method converted by `parse`. The vtables of delta lines are rebuilt
+    from their parent's, using `inherit` on the inherited methods, so those are parsed only once per file.
+    """
+    vtables: dict[str, list[T]] = {}
+    for entry in read_stream_entries(path):
+        methods = [parse(m) for m in entry["methods"]]
+        if "parent" in entry:
+            own = dict(zip(entry["slots"], methods, strict=True))
+            parent_vtable = vtables[entry["parent"]]
+            methods = [own[slot] if slot in own else inherit(parent_vtable[slot]) for slot in range(entry["length"])]
+        vtables[entry["class"]] = methods
+        yield entry["class"], methods
+
+
+def read_methods_stream(path: Path) -> Iterator[tuple[str, list[dict]]]:
+    """Read (class name, methods) pairs, rebuilding the full vtables of a delta stream"""
+    return read_vtables(path, lambda method: method, inherited)
+
+
+def load_methods_file(path: Path) -> dict[str, list[dict]]:
+    """Load a methods file, either streamed (.jsonl) or a methods.json"""
+    if path.suffix == STREAM_SUFFIX:
+        return dict(read_methods_stream(path))
+    with path.open() as f:
+        return json.load(f)
+
+
+def main(args):
+    if len(args) != 3 or args[0] != "to-json":
+        print("Usage: methods_stream.py to-json methods.jsonl methods.json")
+        return
+
+    with open(args[2], "w") as f:
+        json.dump(dict(read_methods_stream(Path(args[1]))), f, indent=4)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,203 @@
+"""
+Sharded output of the merge step, so a consumer interested in a few classes loads only the shards containing them.
+
+Classes are cut into shards of up to `shard_size` classes along the pre-order of the class forest, keeping whole
+subtrees together whenever they fit. Each shard carries only the prototypes its vtables reference.
+
+Format (JSON files in the bundle directory):
+    manifest.json:      version, shards (file, pre-order range of its classes, ranges of its prototype indices),
+                        classes in pre-order as [name, shard, subtree end]
+    shard-NNNN.<hash>.json:
+                        classes (as in classes.json), prototypes (as in prototypes.json, keeping their indices)
+
+Shards are named by their content and the manifest is replaced last, so a reader never mixes shards of two bundles.
+The shards of the previous manifest are kept, for readers that loaded it just before.
+
+`BundleLoader` is the reference loader.
+"""
+
+import hashlib
+import json
+import sys
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+
+from hashed_artifacts import hashed_name
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    EnhancedJSONEncoder,
+    MethodPrototype,
+    read_merged_output,
+    write_text_atomic,
+)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DEFAULT_SHARD_SIZE = 64
+DEFAULT_CACHED_SHARDS = 8
+
+
+def shard_ranges(classes: list[ClassInfo], shard_size: int) -> list[tuple[int, int]]:
+    """
+    Split the classes, in pre-order, into [start, end) ranges of up to `shard_size` classes.
+    A subtree is split only if it does not fit in a shard by itself, in which case its root starts a shard.
+    """
+    ranges = []
+    start = end = 0
+    while end < len(classes):
+        clazz = classes[end]
+        assert clazz.pre_order == end and clazz.subtree_end is not None
+        if clazz.subtree_end - start <= shard_size:
+            end = clazz.subtree_end
+        elif end > start:
+            ranges.append((start, end))
+            start = end
+        else:
+            # Too big for any shard, take the root alone and continue with its children
+            end += 1
+    if end > start:
+        ranges.append((start, end))
+    return ranges
+
+
+def index_ranges(indices: list[int]) -> list[tuple[int, int]]:
+    """Compress sorted unique indices into [start, end) ranges"""
+    ranges: list[tuple[int, int]] = []
+    for index in indices:
+        if ranges and ranges[-1][1] == index:
+            ranges[-1] = (ranges[-1][0], index + 1)
+        else:
+            ranges.append((index, index + 1))
+    return ranges
+
+
+def write_bundle(
+    directory: str | Path,
+    classes: list[ClassInfo],
+    prototypes: list[MethodPrototype],
+    shard_size: int = DEFAULT_SHARD_SIZE,
+):
+    """
+    Write the merge output (classes in pre-order) as a sharded bundle.
+    Shards referenced by neither this nor the previous manifest are removed.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    manifest_path = directory / MANIFEST_NAME
+    previous = json.loads(manifest_path.read_text()) if manifest_path.exists() else {"shards": []}
+
+    shards = []
+    shard_of_class = [0] * len(classes)
+    for shard_index, (start, end) in enumerate(shard_ranges(classes, shard_size)):
+        shard_classes = classes[start:end]
+        referenced = sorted({m.prototype_index for c in shard_classes for m in c.vtable or []})
+        shard = {"classes": shard_classes, "prototypes": [prototypes[i] for i in referenced]}
+        text = json.dumps(shard, cls=EnhancedJSONEncoder)
+        file_name = hashed_name(f"shard-{shard_index:04}.json", hashlib.sha256(text.encode()).hexdigest())
+        # Same content, same name: an existing shard is up to date
+        if not (directory / file_name).exists():
+            write_text_atomic(directory / file_name, text)
+
+        shards.append({"file": file_name, "classes": [start, end], "prototypes": index_ranges(referenced)})
+        shard_of_class[start:end] = [shard_index] * (end - start)
+
+    manifest = {
+        "version": FORMAT_VERSION,
+        "shards": shards,
+        "classes": [[c.name, shard_of_class[i], c.subtree_end] for i, c in enumerate(classes)],
+    }
+    write_text_atomic(manifest_path, json.dumps(manifest, separators=(",", ":")))
+
+    referenced = {shard["file"] for shard in shards} | {shard["file"] for shard in previous["shards"]}
+    for path in directory.glob("shard-*.json"):
+        if path.name not in referenced:
+            path.unlink()
+
+
+@dataclass
+class Shard:
+    classes: dict[str, ClassInfo]
+    prototypes: dict[int, MethodPrototype]
+
+
+class BundleLoader:
+    def __init__(self, directory: str | Path, max_shards: int = DEFAULT_CACHED_SHARDS):
+        self.directory = Path(directory)
+        self.max_shards = max_shards
+        self.hits = 0
+        self.misses = 0
+
+        with (self.directory / MANIFEST_NAME).open() as f:
+            manifest = json.load(f)
+        if manifest.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported bundle version: {manifest.get('version')}")
+        self.shard_files: list[str] = [shard["file"] for shard in manifest["shards"]]
+        # In pre-order: (name, shard index, subtree end)
+        self.class_entries: list[tuple[str, int, int]] = [tuple(entry) for entry in manifest["classes"]]
+        self.class_positions = {name: i for i, (name, _, _) in enumerate(self.class_entries)}
+        self._shards: OrderedDict[int, Shard] = OrderedDict()
+
+    def class_names(self) -> list[str]:
+        return [name for name, _, _ in self.class_entries]
+
+    def get_class(self, name: str) -> ClassInfo:
+        """The class, loading its shard if needed. Raises KeyError for unknown classes."""
+        _, shard_index, _ = self.class_entries[self.class_positions[name]]
+        return self.shard(shard_index).classes[name]
+
+    def get_prototypes(self, name: str) -> list[MethodPrototype]:
+        """The prototypes of the vtable of the class, in vtable order"""
+        _, shard_index, _ = self.class_entries[self.class_positions[name]]
+        shard = self.shard(shard_index)
+        return [shard.prototypes[m.prototype_index] for m in shard.classes[name].vtable or []]
+
+    def subtree(self, name: str) -> list[str]:
+        """The class and its descendants in pre-order, from the manifest alone"""
+        position = self.class_positions[name]
+        _, _, subtree_end = self.class_entries[position]
+        return [name for name, _, _ in self.class_entries[position:subtree_end]]
+
+    def shard(self, index: int) -> Shard:
+        """Load a shard, keeping the `max_shards` most recently used ones in memory"""
+        shard = self._shards.get(index)
+        if shard is not None:
+            self.hits += 1
+            self._shards.move_to_end(index)
+            return shard
+
+        self.misses += 1
+        with (self.directory / self.shard_files[index]).open() as f:
+            data = json.load(f)
+        shard = Shard(
+            classes={c["name"]: ClassInfo.from_output_dict(c) for c in data["classes"]},
+            prototypes={p["protoIndex"]: MethodPrototype.from_dict(p) for p in data["prototypes"]},
+        )
+        self._shards[index] = shard
+        if len(self._shards) > self.max_shards:
+            self._shards.popitem(last=False)
+        return shard
+
+
+def main(args):
+    if len(args) in (2, 4) and args[0] == "build":
+        paths = args[2:4] or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT]
+        write_bundle(args[1], *read_merged_output(*paths))
+        return
+
+    if len(args) != 3 or args[0] != "class":
+        print("Usage: output_bundle.py build bundle_dir [classes.json prototypes.json]")
+        print("       output_bundle.py class bundle_dir class_name")
+        return
+
+    loader = BundleLoader(args[1])
+    clazz = loader.get_class(args[2])
+    print(f"{clazz.name} (parent: {clazz.parent}, abstract: {clazz.is_abstract})")
+    for method, prototype in zip(clazz.vtable or [], loader.get_prototypes(clazz.name), strict=True):
+        print(f"  [{prototype.vtable_index}] {prototype.declaring_class}::{prototype.name} {method.mangled_name or ''}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
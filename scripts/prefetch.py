@@ -0,0 +1,61 @@
+"""
+Prepare the next items of a sequence in background threads while the current one is processed.
+
+At most `depth` items are prepared ahead of the consumer, which bounds the work and the scratch space spent ahead of
+it (backpressure). Each prepared item is cleaned up once the consumer is done with it. Items prepared ahead are cleaned
+up as well if the consumer stops early or fails.
+"""
+
+import contextlib
+from collections import deque
+from collections.abc import Callable, Generator, Iterable
+from concurrent.futures import Future, ThreadPoolExecutor
+
+DEFAULT_DEPTH = 2
+
+
+class Prefetcher[S, T]:
+    def __init__(
+        self,
+        items: Iterable[S],
+        prepare: Callable[[S], T],
+        cleanup: Callable[[T], None] = lambda _: None,
+        depth: int = DEFAULT_DEPTH,
+        workers: int = 1,
+    ):
+        self.items = items
+        self.prepare = prepare
+        self.cleanup = cleanup
+        self.depth = depth
+        self.workers = workers
+
+    def __iter__(self) -> Generator[T]:
+        """Yields the prepared items in order. Preparation errors are raised when their item is reached."""
+        items = iter(self.items)
+        pending: deque[Future[T]] = deque()
+        with ThreadPoolExecutor(self.workers, thread_name_prefix="prefetch") as executor:
+
+            def fill():
+                while len(pending) < self.depth:
+                    try:
+                        item = next(items)
+                    except StopIteration:
+                        return
+                    pending.append(executor.submit(self.prepare, item))
+
+            try:
+                fill()
+                while pending:
+                    prepared = pending.popleft().result()
+                    # Keep `depth` items being prepared while the consumer works on this one. Only refilled once it
+                    # is ready, so no more than `depth` items are ever prepared ahead of the consumer.
+                    fill()
+                    try:
+                        yield prepared
+                    finally:
+                        self.cleanup(prepared)
+            finally:
+                for future in pending:
+                    if not future.cancel():
+                        with contextlib.suppress(Exception):
+                            self.cleanup(future.result())
@@ -0,0 +1,229 @@
+"""
+Persistent SQLite index over the output of merge_vtable_and_classes, with a CLI to query it.
+
+Answers questions like "which classes override externalMethod", "who declares vtable slot 0x5a8"
+or "what class does this mangled name belong to" without scanning classes.json.
+
+Build:  merge_vtable_and_classes.py ... --index classes.sqlite
+        query_index.py build classes.sqlite [classes.json prototypes.json]
+Query:  query_index.py classes.sqlite overrides externalMethod
+"""
+
+import argparse
+import sqlite3
+import sys
+from collections.abc import Iterator
+from pathlib import Path
+
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    MethodPrototype,
+    read_merged_output,
+)
+
+PTR_SIZE = 8
+
+SCHEMA = """
+CREATE TABLE classes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    parent_id INTEGER,
+    is_abstract INTEGER NOT NULL,
+    pre_order INTEGER NOT NULL,
+    subtree_end INTEGER NOT NULL
+);
+CREATE TABLE prototypes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL,
+    mangled_name TEXT NOT NULL,
+    vtable_index INTEGER NOT NULL,
+    declaring_class_id INTEGER
+);
+CREATE TABLE vtable_entries (
+    class_id INTEGER NOT NULL,
+    -- Position in the class' vtable. The vtable index is the prototype's.
+    slot INTEGER NOT NULL,
+    prototype_id INTEGER NOT NULL,
+    is_overridden INTEGER NOT NULL,
+    is_pure_virtual INTEGER NOT NULL,
+    mangled_name TEXT,
+    PRIMARY KEY (class_id, slot)
+) WITHOUT ROWID;
+"""
+
+INDEXES = """
+CREATE INDEX classes_by_parent ON classes(parent_id);
+CREATE INDEX classes_by_pre_order ON classes(pre_order);
+CREATE INDEX prototypes_by_name ON prototypes(name);
+CREATE INDEX prototypes_by_mangled_name ON prototypes(mangled_name);
+CREATE INDEX prototypes_by_vtable_index ON prototypes(vtable_index);
+CREATE INDEX overrides_by_prototype ON vtable_entries(prototype_id) WHERE is_overridden;
+CREATE INDEX entries_by_mangled_name ON vtable_entries(mangled_name) WHERE mangled_name IS NOT NULL;
+"""
+
+
+def build_index(path: str | Path, classes: list[ClassInfo], prototypes: list[MethodPrototype]):
+    """Build a fresh index at `path` from merged classes (numbered by `number_class_forest`) and prototypes."""
+    path = Path(path)
+    path.unlink(missing_ok=True)
+
+    class_ids = {cls.name: i for i, cls in enumerate(classes)}
+    with sqlite3.connect(path) as db:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.executescript(SCHEMA)
+        db.executemany(
+            "INSERT INTO classes VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (i, cls.name, class_ids.get(cls.parent or ""), cls.is_abstract, cls.pre_order, cls.subtree_end)
+                for i, cls in enumerate(classes)
+            ),
+        )
+        db.executemany(
+            "INSERT INTO prototypes VALUES (?, ?, ?, ?, ?)",
+            (
+                (p.proto_index, p.name, p.mangled_name, p.vtable_index, class_ids.get(p.declaring_class))
+                for p in prototypes
+            ),
+        )
+        db.executemany(
+            "INSERT INTO vtable_entries VALUES (?, ?, ?, ?, ?, ?)",
+            (
+                (class_ids[cls.name], slot, m.prototype_index, m.is_overridden, m.is_pure_virtual, m.mangled_name)
+                for cls in classes
+                for slot, m in enumerate(cls.vtable or [])
+            ),
+        )
+        db.executescript(INDEXES)
+        db.execute("ANALYZE")
+    db.close()
+
+
+class QueryIndex:
+    """Read-only queries over an index built by `build_index`."""
+
+    def __init__(self, path: str | Path):
+        self.db = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    def close(self):
+        self.db.close()
+
+    def find_class(self, name: str) -> tuple[str, str | None, bool] | None:
+        """Return (name, parent, is_abstract) of the class"""
+        return self.db.execute(
+            """
+            SELECT c.name, p.name, c.is_abstract FROM classes c
+            LEFT JOIN classes p ON p.id = c.parent_id
+            WHERE c.name = ?
+            """,
+            (name,),
+        ).fetchone()
+
+    def overriding_classes(self, prototype_name: str) -> list[tuple[str, str]]:
+        """Return (class name, mangled name) of every class that overrides a method with the given name"""
+        return self.db.execute(
+            """
+            SELECT c.name, e.mangled_name FROM prototypes p
+            JOIN vtable_entries e ON e.prototype_id = p.id AND e.is_overridden
+            JOIN classes c ON c.id = e.class_id
+            WHERE p.name = ? AND NOT e.is_pure_virtual
+            ORDER BY c.name
+            """,
+            (prototype_name,),
+        ).fetchall()
+
+    def slot_declarations(self, vtable_index: int) -> list[tuple[str, str]]:
+        """Return (declaring class, method name) of every prototype declared at the given vtable index"""
+        return self.db.execute(
+            """
+            SELECT c.name, p.name FROM prototypes p
+            JOIN classes c ON c.id = p.declaring_class_id
+            WHERE p.vtable_index = ?
+            ORDER BY c.name
+            """,
+            (vtable_index,),
+        ).fetchall()
+
+    def find_mangled(self, mangled_name: str) -> list[tuple[str, int]]:
+        """Return (class name, vtable index) of every vtable entry with the given mangled name"""
+        return self.db.execute(
+            """
+            SELECT c.name, p.vtable_index FROM vtable_entries e
+            JOIN classes c ON c.id = e.class_id
+            JOIN prototypes p ON p.id = e.prototype_id
+            WHERE e.mangled_name = ?
+            UNION
+            SELECT c.name, p.vtable_index FROM prototypes p
+            JOIN classes c ON c.id = p.declaring_class_id
+            WHERE p.mangled_name = ?
+            """,
+            (mangled_name, mangled_name),
+        ).fetchall()
+
+    def subtree(self, class_name: str) -> list[str]:
+        """Return the names of the class and all of its descendants"""
+        return [
+            name
+            for (name,) in self.db.execute(
+                """
+                SELECT c.name FROM classes root
+                JOIN classes c ON c.pre_order >= root.pre_order AND c.pre_order < root.subtree_end
+                WHERE root.name = ?
+                ORDER BY c.name
+                """,
+                (class_name,),
+            )
+        ]
+
+
+def parse_slot(slot: str) -> int:
+    """A slot is either a byte offset into the vtable (0x5a8) or an index prefixed with # (#181)"""
+    if slot.startswith("#"):
+        return int(slot[1:], 0)
+    return int(slot, 0) // PTR_SIZE
+
+
+def _format_rows(rows: list) -> Iterator[str]:
+    for row in rows:
+        yield "\t".join("" if col is None else str(col) for col in row) if isinstance(row, tuple) else str(row)
+
+
+def main(args):
+    if args and args[0] == "build":
+        if len(args) not in (2, 4):
+            print("Usage: query_index.py build index.sqlite [classes.json prototypes.json]")
+            return
+        paths = args[2:4] or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT]
+        build_index(args[1], *read_merged_output(*paths))
+        return
+
+    parser = argparse.ArgumentParser(prog="query_index.py")
+    parser.add_argument("index", type=Path)
+    parser.add_argument("query", choices=["class", "overrides", "slot", "mangled", "subtree"])
+    parser.add_argument("value")
+    options = parser.parse_args(args)
+
+    index = QueryIndex(options.index)
+    try:
+        if options.query == "class":
+            result = index.find_class(options.value)
+            rows = [result] if result else []
+        elif options.query == "overrides":
+            rows = index.overriding_classes(options.value)
+        elif options.query == "slot":
+            rows = index.slot_declarations(parse_slot(options.value))
+        elif options.query == "mangled":
+            rows = index.find_mangled(options.value)
+        else:
+            rows = index.subtree(options.value)
+    finally:
+        index.close()
+
+    for line in _format_rows(rows):
+        print(line)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,380 @@
+"""
+Archive of the merge outputs of many releases, storing what does not change between releases once.
+
+The archive keeps global, append-only dictionaries:
+- strings:      names, mangled names and type strings
+- prototypes:   [name, mangled name, return type, [type, name, ...] of the parameters, vtable index, declaring class]
+- classes:      [name, parent, is abstract, vtable or None]
+Strings are referenced by id (-1 for None), and vtables reference prototypes by their id in the dictionary.
+
+A vtable is stored relative to the parent's vtable in the same release, so a class changes only if its own slots do:
+[number of slots inherited, entries], with an entry [slot, prototype, is overridden, is pure virtual, mangled name]
+for every slot that is not inherited as is (the parent's prototype, not overridden, no mangled name).
+
+A release is its sequence of prototype ids (prototypes.json, in order) and of class ids (classes.json, in order).
+Both sequences are stored as a delta against the base release (the first one added): runs [start, length] copied
+from the base's sequence, and the ids that are not in a run.
+
+Format (JSON files in the archive directory):
+    manifest.json:          version, base release, releases (name -> file)
+    dictionary.json:        strings, prototypes, classes
+    release-NNNN.json:      name, prototypes, classes (delta encoded)
+
+`ReleaseArchive` adds releases and reconstructs a whole release or a single class of it.
+
+Usage: release_archive.py add archive_dir release [classes.json prototypes.json]
+       release_archive.py extract archive_dir release output_dir
+       release_archive.py class archive_dir release class_name
+"""
+
+import json
+import sys
+from pathlib import Path
+
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    MethodParam,
+    MethodPrototype,
+    MethodWithPrototype,
+    number_class_forest,
+    read_merged_output,
+    write_json_atomic,
+    write_text_atomic,
+)
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+DICTIONARY_NAME = "dictionary.json"
+NONE_ID = -1
+
+# Ids, and [start, length] runs copied from the base sequence
+type Delta = list[int | list[int]]
+# prototype id, is overridden, is pure virtual, mangled name id
+type VtableEntry = tuple[int, bool, bool, int]
+
+
+def encode_delta(ids: list[int], base: list[int]) -> Delta:
+    """Encode the ids as runs of the base sequence where possible. Ids are unique in a sequence."""
+    base_positions = {id_: position for position, id_ in enumerate(base)}
+    delta: Delta = []
+    i = 0
+    while i < len(ids):
+        start = base_positions.get(ids[i])
+        if start is None:
+            delta.append(ids[i])
+            i += 1
+            continue
+        length = 1
+        while i + length < len(ids) and start + length < len(base) and ids[i + length] == base[start + length]:
+            length += 1
+        delta.append([start, length])
+        i += length
+    return delta
+
+
+def decode_delta(delta: Delta, base: list[int]) -> list[int]:
+    ids: list[int] = []
+    for item in delta:
+        if isinstance(item, list):
+            start, length = item
+            ids.extend(base[start : start + length])
+        else:
+            ids.append(item)
+    return ids
+
+
+class ReleaseArchive:
+    def __init__(self, directory: str | Path):
+        self.directory = Path(directory)
+        manifest_path = self.directory / MANIFEST_NAME
+        if manifest_path.exists():
+            with manifest_path.open() as f:
+                self.manifest = json.load(f)
+            if self.manifest.get("version") != FORMAT_VERSION:
+                raise ValueError(f"Unsupported archive version: {self.manifest.get('version')}")
+            with (self.directory / DICTIONARY_NAME).open() as f:
+                dictionary = json.load(f)
+        else:
+            self.manifest = {"version": FORMAT_VERSION, "base": None, "releases": {}}
+            dictionary = {"strings": [], "prototypes": [], "classes": []}
+        self.strings: list[str] = dictionary["strings"]
+        self.prototypes: list[list] = dictionary["prototypes"]
+        self.classes: list[list] = dictionary["classes"]
+        # Reverse lookups of the dictionary, only built to add releases
+        self._ids: tuple[dict[str, int], dict[tuple, int], dict[tuple, int]] | None = None
+        # release -> (prototype ids, class ids)
+        self._sequences: dict[str, tuple[list[int], list[int]]] = {}
+        # release -> (prototype id -> index, class name -> position) in the release
+        self._lookups: dict[str, tuple[dict[int, int], dict[str, int]]] = {}
+        # release -> position of a class -> its decoded vtable
+        self._vtables: dict[str, dict[int, list[VtableEntry] | None]] = {}
+
+    @property
+    def releases(self) -> list[str]:
+        return list(self.manifest["releases"])
+
+    # region adding releases
+    def add(self, release: str, classes: list[ClassInfo], prototypes: list[MethodPrototype]):
+        """Add (or replace) a release, given the merge output of it"""
+        base = self.manifest["base"]
+        if release == base and len(self.manifest["releases"]) > 1:
+            raise ValueError(f"{release} is the base of the other releases and cannot be replaced")
+
+        string_ids, prototype_ids, class_ids = self._reverse_lookups()
+        intern = self._interner(string_ids)
+        prototype_sequence = [
+            self._intern_record(prototype_ids, self.prototypes, self._prototype_record(p, intern)) for p in prototypes
+        ]
+        vtables = {
+            c.name: [
+                (prototype_sequence[m.prototype_index], m.is_overridden, m.is_pure_virtual, intern(m.mangled_name))
+                for m in c.vtable
+            ]
+            if c.vtable is not None
+            else None
+            for c in classes
+        }
+        class_sequence = [
+            self._intern_record(class_ids, self.classes, self._class_record(c, vtables, intern)) for c in classes
+        ]
+
+        if base is None or release == base:
+            base = self.manifest["base"] = release
+            base_sequences = ([], [])
+        else:
+            base_sequences = self.sequences(base)
+        file_name = self.manifest["releases"].get(release) or f"release-{len(self.manifest['releases']):04}.json"
+        self._sequences[release] = (prototype_sequence, class_sequence)
+        self._lookups.pop(release, None)
+        self._vtables.pop(release, None)
+
+        self.directory.mkdir(parents=True, exist_ok=True)
+        # The dictionary only grows, so it is written before the release and the manifest referencing it
+        write_text_atomic(
+            self.directory / DICTIONARY_NAME,
+            json.dumps({"strings": self.strings, "prototypes": self.prototypes, "classes": self.classes}),
+        )
+        release_data = {
+            "name": release,
+            "prototypes": encode_delta(prototype_sequence, base_sequences[0]),
+            "classes": encode_delta(class_sequence, base_sequences[1]),
+        }
+        write_text_atomic(self.directory / file_name, json.dumps(release_data))
+        self.manifest["releases"][release] = file_name
+        write_json_atomic(self.directory / MANIFEST_NAME, self.manifest)
+
+    def _reverse_lookups(self) -> tuple[dict[str, int], dict[tuple, int], dict[tuple, int]]:
+        if self._ids is None:
+            self._ids = (
+                {string: i for i, string in enumerate(self.strings)},
+                {_frozen(record): i for i, record in enumerate(self.prototypes)},
+                {_frozen(record): i for i, record in enumerate(self.classes)},
+            )
+        return self._ids
+
+    def _interner(self, string_ids: dict[str, int]):
+        def intern(string: str | None) -> int:
+            if string is None:
+                return NONE_ID
+            string_id = string_ids.get(string)
+            if string_id is None:
+                string_id = string_ids[string] = len(self.strings)
+                self.strings.append(string)
+            return string_id
+
+        return intern
+
+    @staticmethod
+    def _intern_record(ids: dict[tuple, int], records: list[list], record: list) -> int:
+        key = _frozen(record)
+        record_id = ids.get(key)
+        if record_id is None:
+            record_id = ids[key] = len(records)
+            records.append(record)
+        return record_id
+
+    @staticmethod
+    def _prototype_record(prototype: MethodPrototype, intern) -> list:
+        return [
+            intern(prototype.name),
+            intern(prototype.mangled_name),
+            intern(prototype.return_type),
+            [intern(s) for p in prototype.parameters for s in (p.type, p.name)],
+            prototype.vtable_index,
+            intern(prototype.declaring_class),
+        ]
+
+    @staticmethod
+    def _class_record(clazz: ClassInfo, vtables: dict[str, list[VtableEntry] | None], intern) -> list:
+        record = [intern(clazz.name), intern(clazz.parent), clazz.is_abstract, None]
+        vtable = vtables[clazz.name]
+        if vtable is not None:
+            parent_vtable = (vtables.get(clazz.parent) if clazz.parent else None) or []
+            inherited = min(len(vtable), len(parent_vtable))
+            entries = [
+                [slot, *entry]
+                for slot, entry in enumerate(vtable)
+                if slot >= inherited or entry != _inherited(parent_vtable[slot])
+            ]
+            record[3] = [inherited, entries]
+        return record
+
+    # endregion
+
+    # region reconstruction
+    def sequences(self, release: str) -> tuple[list[int], list[int]]:
+        """The prototype ids and class ids of the release"""
+        sequences = self._sequences.get(release)
+        if sequences is None:
+            with (self.directory / self.manifest["releases"][release]).open() as f:
+                data = json.load(f)
+            base = self.manifest["base"]
+            base_sequences = ([], []) if release == base else self.sequences(base)
+            sequences = self._sequences[release] = (
+                decode_delta(data["prototypes"], base_sequences[0]),
+                decode_delta(data["classes"], base_sequences[1]),
+            )
+        return sequences
+
+    def load(self, release: str) -> tuple[list[ClassInfo], list[MethodPrototype]]:
+        """The merge output of the release, as written by the merge"""
+        prototype_sequence, class_sequence = self.sequences(release)
+        indices, _ = self._release_lookups(release)
+        prototypes = [self._prototype(prototype_id, index) for index, prototype_id in enumerate(prototype_sequence)]
+        # In pre-order, so the vtable of the parent is already decoded
+        classes = [
+            self._class(class_id, self._vtable(release, position), indices)
+            for position, class_id in enumerate(class_sequence)
+        ]
+        return number_class_forest(classes), prototypes
+
+    def get_class(self, release: str, class_name: str) -> tuple[ClassInfo, list[MethodPrototype]]:
+        """
+        A class of the release and the prototypes of its vtable, without reconstructing the rest of the release.
+        Only `pre_order` of the hierarchy numbering is set, `load` numbers the whole hierarchy.
+        """
+        _, class_sequence = self.sequences(release)
+        indices, positions = self._release_lookups(release)
+        position = positions[class_name]
+        vtable = self._vtable(release, position)
+
+        clazz = self._class(class_sequence[position], vtable, indices)
+        clazz.pre_order = position
+        prototypes = [self._prototype(entry[0], indices[entry[0]]) for entry in vtable or []]
+        return clazz, prototypes
+
+    def _vtable(self, release: str, position: int) -> list[VtableEntry] | None:
+        """The vtable of the class at the position in the release, decoding the vtables of its ancestors as needed"""
+        vtables = self._vtables.setdefault(release, {})
+        _, class_sequence = self.sequences(release)
+        _, positions = self._release_lookups(release)
+
+        # The classes to decode, up to the first ancestor already decoded or not inheriting. Not recursive, as the
+        # hierarchy might be deeper than the recursion limit.
+        chain = []
+        current = position
+        while current not in vtables:
+            chain.append(current)
+            _, parent, _, vtable = self.classes[class_sequence[current]]
+            if vtable is None or vtable[0] == 0:
+                break
+            current = positions[self.strings[parent]]
+
+        for current in reversed(chain):
+            _, parent, _, vtable = self.classes[class_sequence[current]]
+            if vtable is None:
+                vtables[current] = None
+                continue
+            inherited, entries = vtable
+            parent_vtable = vtables[positions[self.strings[parent]]] or [] if inherited else []
+            length = max(inherited, entries[-1][0] + 1 if entries else 0)
+            decoded = [_inherited(entry) for entry in parent_vtable[:inherited]] + [None] * (length - inherited)
+            for slot, *entry in entries:
+                decoded[slot] = tuple(entry)
+            vtables[current] = decoded
+        return vtables[position]
+
+    def _release_lookups(self, release: str) -> tuple[dict[int, int], dict[str, int]]:
+        lookups = self._lookups.get(release)
+        if lookups is None:
+            prototype_sequence, class_sequence = self.sequences(release)
+            lookups = self._lookups[release] = (
+                {prototype_id: index for index, prototype_id in enumerate(prototype_sequence)},
+                {self.strings[self.classes[class_id][0]]: position for position, class_id in enumerate(class_sequence)},
+            )
+        return lookups
+
+    def _string(self, string_id: int) -> str | None:
+        return None if string_id == NONE_ID else self.strings[string_id]
+
+    def _prototype(self, prototype_id: int, index: int) -> MethodPrototype:
+        name, mangled_name, return_type, parameters, vtable_index, declaring_class = self.prototypes[prototype_id]
+        return MethodPrototype(
+            name=self.strings[name],
+            mangled_name=self.strings[mangled_name],
+            return_type=self.strings[return_type],
+            parameters=[
+                MethodParam(self.strings[parameters[i]], self._string(parameters[i + 1]))
+                for i in range(0, len(parameters), 2)
+            ],
+            vtable_index=vtable_index,
+            declaring_class=self.strings[declaring_class],
+            proto_index=index,
+        )
+
+    def _class(self, class_id: int, vtable: list[VtableEntry] | None, indices: dict[int, int]) -> ClassInfo:
+        name, parent, is_abstract, _ = self.classes[class_id]
+        return ClassInfo(
+            name=self.strings[name],
+            parent=self._string(parent),
+            is_abstract=is_abstract,
+            vtable=[
+                MethodWithPrototype(indices[prototype_id], is_overridden, is_pure_virtual, self._string(mangled_name))
+                for prototype_id, is_overridden, is_pure_virtual, mangled_name in vtable
+            ]
+            if vtable is not None
+            else None,
+        )
+
+    # endregion
+
+
+def _inherited(entry: VtableEntry) -> VtableEntry:
+    """The entry of a slot inherited as is from the parent's entry"""
+    prototype_id, _, is_pure_virtual, _ = entry
+    return prototype_id, False, is_pure_virtual, NONE_ID
+
+
+def _frozen(record: list) -> tuple:
+    """A hashable copy of a dictionary record"""
+    return tuple(_frozen(value) if isinstance(value, list) else value for value in record)
+
+
+def main(args):
+    if len(args) in (3, 5) and args[0] == "add":
+        archive = ReleaseArchive(args[1])
+        archive.add(args[2], *read_merged_output(*(args[3:5] or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT])))
+        return
+    if len(args) == 4 and args[0] == "extract":
+        classes, prototypes = ReleaseArchive(args[1]).load(args[2])
+        output = Path(args[3])
+        output.mkdir(parents=True, exist_ok=True)
+        write_json_atomic(output / CLASSES_OUTPUT.name, classes)
+        write_json_atomic(output / PROTOTYPES_OUTPUT.name, prototypes)
+        return
+    if len(args) != 4 or args[0] != "class":
+        print("Usage: release_archive.py add archive_dir release [classes.json prototypes.json]")
+        print("       release_archive.py extract archive_dir release output_dir")
+        print("       release_archive.py class archive_dir release class_name")
+        return
+
+    clazz, prototypes = ReleaseArchive(args[1]).get_class(args[2], args[3])
+    print(f"{clazz.name} (parent: {clazz.parent}, abstract: {clazz.is_abstract})")
+    for method, prototype in zip(clazz.vtable or [], prototypes, strict=True):
+        print(f"  [{prototype.vtable_index}] {prototype.declaring_class}::{prototype.name} {method.mangled_name or ''}")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,103 @@
+"""
+The data layer of ida_renamer: models of the merge output and vtable resolution.
+Does not depend on IDA, so it can be used by offline tooling.
+"""
+
+import json
+from dataclasses import dataclass
+from typing import NamedTuple, TypedDict
+
+OS_METACLASS_BASE = "OSMetaClassBase"
+OS_OBJECT = "OSObject"
+
+
+# region Types of prototypes.json
+class Parameter(TypedDict):
+    """Function parameter type from prototypes.json"""
+
+    type: str
+    name: str
+
+
+class Prototype(TypedDict):
+    """Function prototype type from prototypes.json"""
+
+    name: str
+    mangledName: str
+    returnType: str
+    parameters: list[Parameter]
+    vtableIndex: int
+    declaringClass: str
+    protoIndex: int
+
+
+# endregion
+
+
+# region Types of classes.json
+class VtableEntry(NamedTuple):
+    prototype_index: int
+    is_overridden: bool
+    is_pure_virtual: bool
+    mangled_name: str | None
+
+
+class Clazz(TypedDict):
+    name: str
+    parent: str | None
+    isAbstract: bool
+    vtable: list[VtableEntry] | None
+
+
+# endregion
+
+
+@dataclass
+class RenameStats:
+    classes_renamed: int = 0
+    slots_retyped: int = 0
+    errors: int = 0
+
+
+def unknown_to_int64(typ: str) -> str:
+    """Convert an unknown type (???) to a known type, defaulting to __int64."""
+    if typ == "???":
+        return "__int64"
+    return typ.replace(OS_METACLASS_BASE, OS_OBJECT)
+
+
+## memory vtables utils
+def get_methods_for_type(
+    prototypes: list[Prototype], classes: dict[str, Clazz], type_name: str
+) -> list[tuple[Prototype, str | None]]:
+    """For each type return pairs of (prototype, mangled name) from its vtable"""
+    # search for the first class in the hierarchy chain that it's vtable is not none
+    cls = classes[type_name]
+    while cls.get("vtable") is None:
+        parent = cls.get("parent")
+        if parent is None:
+            print(f"Could not find methods for {type_name}")
+            return []
+        cls = classes[parent]
+
+    return [(prototypes[m.prototype_index], m.mangled_name) for m in cls["vtable"]]
+
+
+def get_file(name: str) -> str:
+    """Given a filename, retrieve it. Override it if you want to use local files instead."""
+    # Imported here as it is the slowest import of the module, and most users have the files
+    import urllib.request
+
+    url = f"https://raw.githubusercontent.com/yoavst/IOKitClassExplorer/refs/heads/main/src/{name}"
+    return urllib.request.urlopen(url).read()  # noqa: S310
+
+
+def parse_classes(classes: list[Clazz]) -> list[Clazz]:
+    """Convert the vtables of classes.json entries to `VtableEntry`, in place"""
+    for cls in classes:
+        cls["vtable"] = [VtableEntry(*m) for m in cls["vtable"] or []] if cls.get("vtable") else None
+    return classes
+
+
+def get_classes() -> list[Clazz]:
+    return parse_classes(json.loads(get_file("classes.json")))
@@ -0,0 +1,159 @@
+"""
+Prebuilt trigram search index over class names, prototype names and mangled names of the merge output.
+
+Format (JSON):
+    terms:            unique searchable strings, sorted case-insensitively (so prefix search is a bisect)
+    term_classes:     for each term, delta-encoded indices into classes.json of the classes it names or implements
+    term_prototypes:  for each term, delta-encoded indices into prototypes.json of the prototypes it names
+    trigrams:         lowercase trigram -> delta-encoded indices of the terms containing it
+
+`SearchIndex` is the reference query implementation.
+"""
+
+import bisect
+import itertools
+import json
+import sys
+from collections import defaultdict
+from dataclasses import dataclass
+from pathlib import Path
+
+from merge_vtable_and_classes import (
+    CLASSES_OUTPUT,
+    PROTOTYPES_OUTPUT,
+    ClassInfo,
+    MethodPrototype,
+    read_merged_output,
+    write_json_atomic,
+)
+
+FORMAT_VERSION = 1
+NGRAM = 3
+
+
+def trigrams(text: str) -> set[str]:
+    """The set of lowercase trigrams of the text"""
+    text = text.lower()
+    return {text[i : i + NGRAM] for i in range(len(text) - NGRAM + 1)}
+
+
+def delta_encode(values: list[int]) -> list[int]:
+    """Encode a sorted list as differences between consecutive values"""
+    return [value - prev for prev, value in zip([0, *values], values, strict=False)]
+
+
+def delta_decode(deltas: list[int]) -> list[int]:
+    return list(itertools.accumulate(deltas))
+
+
+def build_search_index(classes: list[ClassInfo], prototypes: list[MethodPrototype]) -> dict:
+    """Build the search index of the merge output, as a JSON compatible dict"""
+    term_classes: dict[str, set[int]] = defaultdict(set)
+    term_prototypes: dict[str, set[int]] = defaultdict(set)
+
+    for class_index, cls in enumerate(classes):
+        term_classes[cls.name].add(class_index)
+        for method in cls.vtable or []:
+            if method.mangled_name:
+                term_classes[method.mangled_name].add(class_index)
+                term_prototypes[method.mangled_name].add(method.prototype_index)
+    for prototype in prototypes:
+        for term in (prototype.name, prototype.mangled_name):
+            if term:
+                term_prototypes[term].add(prototype.proto_index)
+
+    terms = sorted(term_classes.keys() | term_prototypes.keys(), key=lambda t: (t.lower(), t))
+    trigram_terms: dict[str, list[int]] = defaultdict(list)
+    for term_index, term in enumerate(terms):
+        for trigram in trigrams(term):
+            trigram_terms[trigram].append(term_index)
+
+    return {
+        "version": FORMAT_VERSION,
+        "terms": terms,
+        "term_classes": [delta_encode(sorted(term_classes.get(term, ()))) for term in terms],
+        "term_prototypes": [delta_encode(sorted(term_prototypes.get(term, ()))) for term in terms],
+        "trigrams": {trigram: delta_encode(term_ids) for trigram, term_ids in sorted(trigram_terms.items())},
+    }
+
+
+def write_search_index(path: str | Path, classes: list[ClassInfo], prototypes: list[MethodPrototype]):
+    # Atomically, so the frontend never loads a partial index while it is regenerated
+    write_json_atomic(Path(path), build_search_index(classes, prototypes), separators=(",", ":"))
+
+
+@dataclass
+class SearchResult:
+    terms: list[str]
+    class_indices: list[int]
+    prototype_indices: list[int]
+
+
+class SearchIndex:
+    """Reference query implementation over the output of `build_search_index`."""
+
+    def __init__(self, data: dict):
+        if data.get("version") != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version: {data.get('version')}")
+        self.terms: list[str] = data["terms"]
+        self._lower_terms = [term.lower() for term in self.terms]
+        self._term_classes: list[list[int]] = data["term_classes"]
+        self._term_prototypes: list[list[int]] = data["term_prototypes"]
+        self._trigrams: dict[str, list[int]] = data["trigrams"]
+
+    @classmethod
+    def load(cls, path: str | Path) -> "SearchIndex":
+        with open(path) as f:
+            return cls(json.load(f))
+
+    def matching_terms(self, query: str) -> list[int]:
+        """
+        Indices of the terms containing the query, case-insensitive.
+        Queries shorter than a trigram cannot use the trigram index, so they match by prefix instead.
+        """
+        query = query.lower()
+        if len(query) < NGRAM:
+            return self.prefix_terms(query)
+
+        # Only the rarest trigram is decoded, the candidates are verified directly as it is cheaper than intersecting
+        rarest = min((self._trigrams.get(trigram, []) for trigram in trigrams(query)), key=len)
+        return [i for i in delta_decode(rarest) if query in self._lower_terms[i]]
+
+    def prefix_terms(self, prefix: str) -> list[int]:
+        """Indices of the terms starting with the prefix, case-insensitive"""
+        prefix = prefix.lower()
+        start = bisect.bisect_left(self._lower_terms, prefix)
+        end = start
+        while end < len(self._lower_terms) and self._lower_terms[end].startswith(prefix):
+            end += 1
+        return list(range(start, end))
+
+    def search(self, query: str) -> SearchResult:
+        term_ids = self.matching_terms(query)
+        class_indices: set[int] = set()
+        prototype_indices: set[int] = set()
+        for i in term_ids:
+            class_indices.update(delta_decode(self._term_classes[i]))
+            prototype_indices.update(delta_decode(self._term_prototypes[i]))
+        return SearchResult([self.terms[i] for i in term_ids], sorted(class_indices), sorted(prototype_indices))
+
+
+def main(args):
+    if len(args) in (2, 4) and args[0] == "build":
+        paths = args[2:4] or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT]
+        write_search_index(args[1], *read_merged_output(*paths))
+        return
+
+    if len(args) != 3 or args[0] != "search":
+        print("Usage: search_index.py build index.json [classes.json prototypes.json]")
+        print("       search_index.py search index.json query")
+        return
+
+    result = SearchIndex.load(args[1]).search(args[2])
+    for term in result.terms:
+        print(term)
+    print(f"{len(result.terms)} terms, {len(result.class_indices)} classes, {len(result.prototype_indices)} prototypes")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
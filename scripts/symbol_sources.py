@@ -0,0 +1,130 @@
+"""
+Symbol sources: methods files of other (usually symbolicated) releases, used to fill what the extraction left unknown.
+
+Each source has a priority, higher wins (on a tie, the source given first wins). One pass over all the sources builds
+a `SymbolIndex` holding, per class:
+- the vtable of the best source having the class, used for classes missing from the input
+- per vtable length and slot, the best candidate: a named, non pure virtual method. Only candidates from a vtable of
+  the same length as the input's are used, so that the slots line up.
+
+The index then fills unnamed (`sub_`) slots and `???` types of the input, and records which source won each slot.
+"""
+
+from dataclasses import dataclass
+from pathlib import Path
+
+from merge_vtable_and_classes import UNKNOWN, CompactMethod, InputMethod, has_unknown_parameters, parse_methods_file
+
+DEFAULT_PRIORITY = 0
+
+
+@dataclass(frozen=True)
+class SymbolSource:
+    path: Path
+    priority: int = DEFAULT_PRIORITY
+
+    @classmethod
+    def parse(cls, spec: str) -> "SymbolSource":
+        """Parse `path` or `path:priority`"""
+        path, _, priority = spec.rpartition(":")
+        if path and priority.lstrip("-").isdigit():
+            return cls(Path(path), int(priority))
+        return cls(Path(spec))
+
+
+@dataclass
+class Candidate:
+    source: Path
+    priority: int
+    method: CompactMethod
+
+
+# class name -> vtable index -> path of the source that filled it (file names alone may collide)
+type SymbolProvenance = dict[str, dict[int, str]]
+
+
+class SymbolIndex:
+    def __init__(self):
+        # class name -> (priority, source path, vtable)
+        self.classes: dict[str, tuple[int, Path, list[CompactMethod]]] = {}
+        # class name -> (vtable length, vtable index) -> best candidate
+        self.slots: dict[str, dict[tuple[int, int], Candidate]] = {}
+
+    @classmethod
+    def build(cls, sources: list[SymbolSource], class_names: frozenset[str]) -> "SymbolIndex":
+        index = cls()
+        for source in sources:
+            index.add(source, parse_methods_file(source.path, class_names))
+        return index
+
+    def add(self, source: SymbolSource, parsed: list[tuple[str, list[CompactMethod]]]):
+        """Add the parsed methods file of the source, keeping the best candidate of every class and slot"""
+        for class_name, methods in parsed:
+            if class_name.endswith("::MetaClass"):
+                continue
+            best = self.classes.get(class_name)
+            if best is None or source.priority > best[0]:
+                self.classes[class_name] = (source.priority, source.path, methods)
+
+            slots = self.slots.setdefault(class_name, {})
+            for method in methods:
+                name, _, _, _, is_pure_virtual, _, vtable_index = method
+                if not name or is_pure_virtual:
+                    continue
+                current = slots.get((len(methods), vtable_index))
+                if current is None or source.priority > current.priority:
+                    slots[len(methods), vtable_index] = Candidate(source.path, source.priority, method)
+
+    def class_methods(self, class_name: str) -> tuple[Path, list[InputMethod]] | None:
+        """The source and a fresh copy of the vtable of the best source having the class, if any"""
+        best = self.classes.get(class_name)
+        if best is None:
+            return None
+        _, source, methods = best
+        return source, [InputMethod.from_tuple(m) for m in methods]
+
+    def enrich(self, class_name: str, methods: list[InputMethod]) -> dict[int, Path]:
+        """Fill unknown names and types of the methods in place. Returns the source of every filled slot."""
+        slots = self.slots.get(class_name)
+        if not slots:
+            return {}
+
+        filled = {}
+        for method in methods:
+            candidate = slots.get((len(methods), method.vtable_index))
+            if candidate is None or method.is_pure_virtual:
+                continue
+            if _fill(method, InputMethod.from_tuple(candidate.method)):
+                filled[method.vtable_index] = candidate.source
+        return filled
+
+    def apply(self, input_methods: dict[str, list[InputMethod]]) -> SymbolProvenance:
+        """Add the classes missing from the input and enrich the rest"""
+        provenance: SymbolProvenance = {}
+        for class_name in self.classes.keys() - input_methods.keys():
+            if (best := self.class_methods(class_name)) is not None:
+                source, input_methods[class_name] = best
+                provenance[class_name] = {m.vtable_index: str(source) for m in input_methods[class_name]}
+        for class_name in self.slots.keys() & input_methods.keys():
+            if class_name not in provenance and (filled := self.enrich(class_name, input_methods[class_name])):
+                provenance[class_name] = {slot: str(source) for slot, source in filled.items()}
+        return provenance
+
+
+def _fill(method: InputMethod, candidate: InputMethod) -> bool:
+    """Fill the unknowns of the method from a candidate of the same slot. Returns whether anything was filled."""
+    filled = False
+    if not method.name:
+        method.name, method.mangled_name = candidate.name, candidate.mangled_name
+        filled = True
+    elif method.name != candidate.name:
+        # A different method in this release
+        return False
+
+    if method.return_type == UNKNOWN and candidate.return_type != UNKNOWN:
+        method.return_type = candidate.return_type
+        filled = True
+    if has_unknown_parameters(method.parameters) and not has_unknown_parameters(candidate.parameters):
+        method.parameters = candidate.parameters
+        filled = True
+    return filled
@@ -0,0 +1,74 @@
+from pathlib import Path
+
+from batch_renamer import STATUS_FAILED, STATUS_OK, RenameIndex, rename_database, rename_databases
+
+
+class FakeBackend:
+    """Records the opened databases in a log file next to them, and fails to open the ones named broken"""
+
+    def __init__(self):
+        self.path: Path | None = None
+
+    def open(self, path: Path, run_auto_analysis: bool):
+        if path.stem == "broken":
+            raise RuntimeError(f"cannot open {path.name}")
+        self.path = path
+        with (path.parent / "log").open("a") as f:
+            f.write(f"open {path.name} {run_auto_analysis}\n")
+
+    def close(self, save: bool):
+        assert self.path is not None
+        with (self.path.parent / "log").open("a") as f:
+            f.write(f"close {self.path.name} {save}\n")
+        self.path = None
+
+
+# The backend factory and the renamer run in spawned worker processes, so they are module level
+def fake_rename(index: RenameIndex, force_apply: bool) -> tuple[int, int, int]:
+    return len(index.classes), len(index.prototypes), int(force_apply)
+
+
+def failing_rename(index: RenameIndex, force_apply: bool) -> tuple[int, int, int]:
+    raise ValueError("bad prototype")
+
+
+INDEX = RenameIndex([{"name": "f"}, {"name": "g"}], {"OSObject": {"name": "OSObject"}})  # pyright: ignore[reportArgumentType]
+
+
+def test_rename_database(tmp_path: Path):
+    summary = rename_database(tmp_path / "kernel.i64", INDEX, FakeBackend(), fake_rename, True)
+    assert (summary.status, summary.classes_renamed, summary.slots_retyped, summary.errors) == (STATUS_OK, 1, 2, 1)
+    # A database is not analyzed again, and is saved
+    assert (tmp_path / "log").read_text().splitlines() == ["open kernel.i64 False", "close kernel.i64 True"]
+
+
+def test_binary_is_analyzed(tmp_path: Path):
+    rename_database(tmp_path / "kernelcache", INDEX, FakeBackend(), fake_rename)
+    assert (tmp_path / "log").read_text().splitlines()[0] == "open kernelcache True"
+
+
+def test_renamer_failure_closes_database_unsaved(tmp_path: Path):
+    summary = rename_database(tmp_path / "kernel.i64", INDEX, FakeBackend(), failing_rename)
+    assert summary.status == STATUS_FAILED
+    assert "bad prototype" in (summary.error or "")
+    assert (tmp_path / "log").read_text().splitlines()[-1] == "close kernel.i64 False"
+
+
+def test_rename_databases(tmp_path: Path):
+    paths = [tmp_path / "a.i64", tmp_path / "broken.i64", tmp_path / "b.idb", tmp_path / "kernelcache"]
+    summaries = rename_databases(paths, INDEX, 2, FakeBackend, fake_rename)
+
+    # In the order of the paths, and a database that fails to open does not stop the others
+    assert [summary.path for summary in summaries] == [str(path) for path in paths]
+    assert [summary.status for summary in summaries] == [STATUS_OK, STATUS_FAILED, STATUS_OK, STATUS_OK]
+    assert "cannot open broken.i64" in (summaries[1].error or "")
+    assert summaries[1].classes_renamed == 0
+    assert all(
+        (summary.classes_renamed, summary.slots_retyped) == (1, 2)
+        for summary in summaries
+        if summary.status == STATUS_OK
+    )
+
+    log = set((tmp_path / "log").read_text().splitlines())
+    assert {"open a.i64 False", "open b.idb False", "open kernelcache True", "close kernelcache True"} <= log
+    assert not any("broken" in line for line in log)
@@ -0,0 +1,69 @@
+import json
+import time
+from pathlib import Path
+
+from file_supervisor import STATUS_FAILED, STATUS_MEMORY, STATUS_OK, STATUS_TIMEOUT, Supervisor
+
+
+# Workers run in a spawned child process, so they are module level functions
+def write_worker(path: Path, text: str):
+    path.write_text(text)
+
+
+def failing_worker(path: Path):
+    raise RuntimeError(f"cannot process {path}")
+
+
+def hanging_worker(path: Path):
+    time.sleep(60)
+
+
+def test_ok(tmp_path: Path):
+    supervisor = Supervisor(write_worker, timeout=30, poll_interval=0.05, rss_reader=lambda pid: 1)
+    result = supervisor.run(tmp_path / "kext", "extracted")
+    assert (result.status, result.exit_code, result.path) == (STATUS_OK, 0, str(tmp_path / "kext"))
+    assert (tmp_path / "kext").read_text() == "extracted"
+
+
+def test_failed(tmp_path: Path):
+    result = Supervisor(failing_worker, poll_interval=0.05, rss_reader=lambda pid: 1).run(tmp_path / "kext")
+    assert result.status == STATUS_FAILED
+    assert result.exit_code not in (0, None)
+
+
+def test_timeout(tmp_path: Path):
+    supervisor = Supervisor(hanging_worker, timeout=0.5, poll_interval=0.05, rss_reader=lambda pid: 1)
+    result = supervisor.run(tmp_path / "kext")
+    assert result.status == STATUS_TIMEOUT
+    assert 0.5 < result.duration < 30
+
+
+def test_memory_limit(tmp_path: Path):
+    supervisor = Supervisor(hanging_worker, max_rss=2**30, poll_interval=0.05, rss_reader=lambda pid: 2**31)
+    result = supervisor.run(tmp_path / "kext")
+    assert (result.status, result.peak_rss) == (STATUS_MEMORY, 2**31)
+    assert result.duration < 30
+
+
+def test_continues_after_a_failure_and_reports_it(tmp_path: Path):
+    supervisor = Supervisor(failing_worker, timeout=30, poll_interval=0.05, rss_reader=lambda pid: 1)
+    supervisor.run(tmp_path / "bad")
+    supervisor.worker = write_worker
+    supervisor.run(tmp_path / "good", "extracted")
+
+    supervisor.write_report(tmp_path / "report.json", slow_threshold=0)
+    with (tmp_path / "report.json").open() as f:
+        report = json.load(f)
+    assert [r["path"] for r in report["skipped"]] == [str(tmp_path / "bad")]
+    assert [r["path"] for r in report["slow"]] == [str(tmp_path / "good")]
+    assert report["total_files"] == 2
+
+
+def test_record_failure(tmp_path: Path):
+    supervisor = Supervisor(write_worker)
+    supervisor.record_failure(tmp_path / "kext", "OSError('copy failed')")
+    supervisor.write_report(tmp_path / "report.json", slow_threshold=1)
+    report = json.loads((tmp_path / "report.json").read_text())
+    assert [(r["path"], r["status"], r["exit_code"]) for r in report["skipped"]] == [
+        (str(tmp_path / "kext"), STATUS_FAILED, None)
+    ]
@@ -0,0 +1,33 @@
+import hashlib
+import json
+from pathlib import Path
+
+from hashed_artifacts import MANIFEST_NAME, hashed_name, write_artifacts
+
+
+def test_unrelated_files_are_kept(tmp_path: Path):
+    (tmp_path / "index.html").write_text("<html></html>")
+    (tmp_path / "favicon.ico").write_bytes(b"icon")
+    (tmp_path / "notes.0123456789abcdef.txt").write_text("not ours")
+
+    write_artifacts(tmp_path, {"classes.json": b"[1]"})
+    write_artifacts(tmp_path, {"classes.json": b"[2]"})
+
+    for name in ("index.html", "favicon.ico", "notes.0123456789abcdef.txt"):
+        assert (tmp_path / name).exists()
+
+
+def test_stale_hashed_files_are_removed(tmp_path: Path):
+    first = write_artifacts(tmp_path, {"classes.json": b"[1]"})
+    write_artifacts(tmp_path, {"classes.json": b"[2]"})
+    third = write_artifacts(tmp_path, {"classes.json": b"[3]"})
+
+    stale = first["files"]["classes.json"]
+    assert not (tmp_path / stale["file"]).exists()
+    assert not any((tmp_path / encoding["file"]).exists() for encoding in stale["encodings"].values())
+
+    # The current and the previous manifest's files stay
+    names = {path.name for path in tmp_path.iterdir()}
+    assert third["files"]["classes.json"]["file"] in names
+    assert hashed_name("classes.json", hashlib.sha256(b"[2]").hexdigest()) in names
+    assert json.loads((tmp_path / MANIFEST_NAME).read_text()) == third
@@ -0,0 +1,112 @@
+import json
+from pathlib import Path
+
+import pytest
+from idb_cache import DATABASE_SUFFIX, MANIFEST_NAME, IdbCache
+
+
+class FakeBackend:
+    """Creates a database next to an analyzed binary, like idalib"""
+
+    def __init__(self, database_size: int = 100):
+        self.database_size = database_size
+        self.opened: list[tuple[Path, bool]] = []
+        self.closed: list[bool] = []
+
+    def open(self, path: Path, run_auto_analysis: bool):
+        self.opened.append((path, run_auto_analysis))
+        if run_auto_analysis:
+            path.with_name(path.name + DATABASE_SUFFIX).write_bytes(b"\0" * self.database_size)
+        else:
+            assert path.exists()
+
+    def close(self, save: bool):
+        self.closed.append(save)
+
+
+@pytest.fixture
+def binary(tmp_path: Path) -> Path:
+    path = tmp_path / "kext"
+    path.write_bytes(b"binary")
+    return path
+
+
+def open_once(cache: IdbCache, binary: Path):
+    with cache.open(binary):
+        pass
+
+
+def test_miss_then_hit(tmp_path: Path, binary: Path):
+    backend = FakeBackend()
+    cache = IdbCache(tmp_path / "cache", backend)
+    open_once(cache, binary)
+    open_once(cache, binary)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    (analyzed, analyze), (reopened, reanalyze) = backend.opened
+    assert analyze and not reanalyze
+    assert analyzed.parent.parent == tmp_path / "cache"
+    assert reopened == analyzed.with_name(analyzed.name + DATABASE_SUFFIX)
+    # The analysis is saved, reopening does not change the cached database
+    assert backend.closed == [True, False]
+    # Only the database is kept
+    assert [p.name for p in analyzed.parent.iterdir()] == [binary.name + DATABASE_SUFFIX]
+
+
+def test_hit_across_instances(tmp_path: Path, binary: Path):
+    open_once(IdbCache(tmp_path / "cache", FakeBackend()), binary)
+    cache = IdbCache(tmp_path / "cache", FakeBackend())
+    open_once(cache, binary)
+    assert (cache.hits, cache.misses) == (1, 0)
+
+
+def test_changed_binary_is_analyzed_again(tmp_path: Path, binary: Path):
+    cache = IdbCache(tmp_path / "cache", FakeBackend())
+    open_once(cache, binary)
+    binary.write_bytes(b"new binary")
+    open_once(cache, binary)
+    assert (cache.hits, cache.misses) == (0, 2)
+    assert len(cache.entries) == 2
+
+
+def test_precomputed_digest(tmp_path: Path, binary: Path):
+    cache = IdbCache(tmp_path / "cache", FakeBackend())
+    with cache.open(binary, "a" * 64):
+        pass
+    assert list(cache.entries) == ["a" * 64]
+
+
+def test_missing_database_is_analyzed_again(tmp_path: Path, binary: Path):
+    cache = IdbCache(tmp_path / "cache", FakeBackend())
+    open_once(cache, binary)
+    (entry,) = cache.entries.values()
+    (tmp_path / "cache" / entry.database).unlink()
+    open_once(cache, binary)
+    assert (cache.hits, cache.misses) == (0, 2)
+
+
+def test_eviction_keeps_the_quota(tmp_path: Path):
+    cache = IdbCache(tmp_path / "cache", FakeBackend(database_size=100), quota_bytes=250)
+    binaries = []
+    for i in range(3):
+        binary = tmp_path / f"kext{i}"
+        binary.write_bytes(f"binary {i}".encode())
+        binaries.append(binary)
+        open_once(cache, binary)
+
+    assert [entry.name for entry in cache.entries.values()] == ["kext1", "kext2"]
+    assert len([p for p in (tmp_path / "cache").iterdir() if p.is_dir()]) == 2
+    # The least recently used database was evicted
+    open_once(cache, binaries[0])
+    assert cache.misses == 4
+
+
+def test_corrupt_manifest(tmp_path: Path, binary: Path):
+    (tmp_path / "cache").mkdir()
+    (tmp_path / "cache" / MANIFEST_NAME).write_text("{not json")
+    cache = IdbCache(tmp_path / "cache", FakeBackend())
+    assert cache.entries == {}
+
+    open_once(cache, binary)
+    with (tmp_path / "cache" / MANIFEST_NAME).open() as f:
+        assert len(json.load(f)) == 1
@@ -0,0 +1,127 @@
+import importlib
+import importlib.util
+import sys
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+# address -> (mangled name, return type, parameters). No return type: IDA has no type for the function.
+# No parameters: IDA has no details for the type.
+FUNCTIONS = {
+    0x100: ("A::free", "void", [("OSObject *", "this")]),
+    0x108: ("A::init", "bool", [("A *", "this"), ("int", "flags")]),
+    0x110: ("___cxa_pure_virtual", None, None),
+    0x200: ("B::init", "bool", None),
+    0x208: ("B::start", None, None),
+    0x300: ("C::stop", "void", [("C *", "this"), ("IOService *", "provider")]),
+}
+VTABLES = {
+    "A": [0x100, 0x108, 0x110],
+    "B": [0x100, 0x200, 0x110, 0x208],
+    "C": [0x100, 0x200, 0x110, 0x208, 0x300],
+    "D": [0x100, 0x200, 0x110, 0x208, 0x300],
+}
+
+
+class FakeType:
+    def __init__(self, text: str):
+        self.text = text
+
+    def dstr(self) -> str:
+        return self.text
+
+
+class FakeFuncType:
+    def __init__(self, func_ea: int):
+        self.func_ea = func_ea
+
+    def get_rettype(self) -> FakeType:
+        return FakeType(FUNCTIONS[self.func_ea][1] or "")
+
+
+class FakeFuncDetails(list):
+    def size(self) -> int:
+        return len(self)
+
+
+class FakeTif:
+    def __init__(self):
+        self.resolved: list[int] = []
+
+    def from_ea(self, func_ea: int) -> FakeFuncType | None:
+        self.resolved.append(func_ea)
+        return FakeFuncType(func_ea) if FUNCTIONS[func_ea][1] is not None else None
+
+    def get_func_details(self, func_type: FakeFuncType) -> FakeFuncDetails | None:
+        parameters = FUNCTIONS[func_type.func_ea][2]
+        if parameters is None:
+            return None
+        return FakeFuncDetails(SimpleNamespace(type=FakeType(typ), name=name) for typ, name in parameters)
+
+
+def iterate_vtable(vtable_ea: str, skip_reserved: bool, raise_on_error: bool):
+    for index, func_ea in enumerate(VTABLES[vtable_ea]):
+        name = FUNCTIONS[func_ea][0]
+        yield SimpleNamespace(func_ea=func_ea, func_name=name, demangled_func_name=name, index=index)
+
+
+FAKE_CPP = SimpleNamespace(
+    demangle=lambda name: None if "pure" in name else f"{name}(int, char)",
+    demangle_class_and_name=lambda name: None if "pure" in name else tuple(name.split("::")),
+    iterate_vtable=iterate_vtable,
+    # The vtable "address" is the class name
+    iterate_vtables=lambda: [(name, name) for name in VTABLES],
+)
+
+
+@pytest.fixture
+def extractor(monkeypatch: pytest.MonkeyPatch) -> tuple[ModuleType, FakeTif]:
+    # idahelper needs IDA. Everything the extraction uses from it is replaced below.
+    if importlib.util.find_spec("idahelper") is None:
+        monkeypatch.setitem(sys.modules, "idahelper", SimpleNamespace(cpp=None, memory=None, tif=None))
+    module = importlib.import_module("kdk_extract_vtable")
+
+    tif = FakeTif()
+    monkeypatch.setattr(module, "tif", tif)
+    monkeypatch.setattr(module, "cpp", FAKE_CPP)
+    monkeypatch.setattr(module, "memory", SimpleNamespace(imports=SimpleNamespace(cache_clear=lambda: None)))
+    return module, tif
+
+
+def test_cached_types_match_uncached(extractor: tuple[ModuleType, FakeTif]):
+    module, tif = extractor
+    uncached = {name: module.extract_vtable(name, ea) for name, ea in FAKE_CPP.iterate_vtables()}
+    assert len(tif.resolved) == sum(len(vtable) for vtable in VTABLES.values())
+
+    tif.resolved.clear()
+    cached = module.get_methods()
+    assert cached == uncached
+    # Each function is typed once
+    assert sorted(tif.resolved) == sorted(FUNCTIONS)
+
+
+def test_types(extractor: tuple[ModuleType, FakeTif]):
+    module, _ = extractor
+    methods = module.extract_vtable("B", "B", module.FuncTypesCache())
+    assert [(m.name, m.is_implemented_by_current_class, m.is_pure_virtual) for m in methods] == [
+        ("free", False, False),
+        ("init", True, False),
+        ("___cxa_pure_virtual", False, True),
+        ("start", True, False),
+    ]
+    # From the type without its this parameter, without details of the type, and from the demangled name
+    assert methods[0].parameters == []
+    assert (methods[1].return_type, methods[1].parameters) == ("bool", [module.MethodParam("???")])
+    assert (methods[3].return_type, methods[3].parameters) == (
+        "???",
+        [module.MethodParam("int"), module.MethodParam("char")],
+    )
+
+
+def test_disabled_cache(extractor: tuple[ModuleType, FakeTif]):
+    module, tif = extractor
+    func_types = module.FuncTypesCache(enabled=False)
+    module.extract_vtable("C", "C", func_types)
+    module.extract_vtable("D", "D", func_types)
+    assert (func_types.hits, func_types.misses, func_types.entries) == (0, 10, {})
+    assert len(tif.resolved) == 10
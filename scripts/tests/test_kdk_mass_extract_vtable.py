@@ -0,0 +1,91 @@
+import importlib
+import importlib.util
+import struct
+import sys
+from pathlib import Path
+from types import ModuleType, SimpleNamespace
+
+import pytest
+
+MH_MAGIC_64 = b"\xcf\xfa\xed\xfe"
+MH_EXECUTE = 0x2
+MH_DSYM = 0xA
+MH_KEXT_BUNDLE = 0xB
+
+
+def mach_o(filetype: int) -> bytes:
+    return MH_MAGIC_64 + struct.pack("<iiI", 0x0100000C, 0, filetype) + b"\0" * 64
+
+
+@pytest.fixture
+def extractor(monkeypatch: pytest.MonkeyPatch) -> ModuleType:
+    # IDA is not needed to prepare the files, and the analysis is replaced by the tests
+    for name in ("idahelper", "ida"):
+        if importlib.util.find_spec(name) is None:
+            monkeypatch.setitem(sys.modules, name, SimpleNamespace(cpp=None, memory=None, tif=None))
+    return importlib.import_module("kdk_mass_extract_vtable")
+
+
+@pytest.fixture
+def kdk(tmp_path: Path) -> Path:
+    folder = tmp_path / "kdk"
+    (folder / "Extensions" / "A.kext").mkdir(parents=True)
+    (folder / "Extensions" / "A.kext" / "A").write_bytes(mach_o(MH_KEXT_BUNDLE))
+    (folder / "Extensions" / "A.kext" / "Info.plist").write_text("<plist/>")
+    (folder / "Extensions" / "B").write_bytes(mach_o(MH_KEXT_BUNDLE))
+    (folder / "Extensions" / "broken").write_bytes(mach_o(MH_KEXT_BUNDLE))
+    (folder / "Extensions" / "B.dSYM").write_bytes(mach_o(MH_DSYM))
+    (folder / "kernel").write_bytes(mach_o(MH_EXECUTE))
+    return folder
+
+
+def test_get_all_kexts(extractor: ModuleType, kdk: Path):
+    assert sorted(path.name for path in extractor.get_all_kexts(kdk)) == ["A", "B", "broken"]
+
+
+def test_prepare_file(extractor: ModuleType, kdk: Path, tmp_path: Path):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    kext = kdk / "Extensions" / "B"
+
+    prepared = extractor.prepare_file(kext, scratch, hash_binary=True)
+    assert prepared.error is None
+    assert prepared.path.parent.parent == scratch
+    assert prepared.path.read_bytes() == kext.read_bytes()
+    assert prepared.digest is not None
+    extractor.cleanup_file(prepared)
+    assert not any(scratch.iterdir())
+
+
+def test_prepare_failure_is_returned(extractor: ModuleType, tmp_path: Path):
+    scratch = tmp_path / "scratch"
+    scratch.mkdir()
+    prepared = extractor.prepare_file(tmp_path / "missing", scratch)
+    assert (prepared.error or "").startswith("FileNotFoundError")
+    # The staging folder of the failed copy is removed
+    assert not any(scratch.iterdir())
+
+
+def test_main_skips_failed_and_non_kext_files(
+    extractor: ModuleType, kdk: Path, tmp_path: Path, monkeypatch: pytest.MonkeyPatch, capsys: pytest.CaptureFixture
+):
+    thin_binary = extractor.thin_binary
+
+    def failing_thin_binary(binary: Path) -> Path:
+        if binary.name == "broken":
+            raise OSError(f"cannot thin {binary.name}")
+        return thin_binary(binary)
+
+    analyzed = []
+    monkeypatch.setattr(extractor, "thin_binary", failing_thin_binary)
+    monkeypatch.setattr(extractor, "open_and_process_file", lambda path, *args: analyzed.append(path))
+    monkeypatch.chdir(tmp_path)
+    scratch = tmp_path / "scratch"
+
+    extractor.main([str(kdk), str(kdk / "kernel"), "--scratch", str(scratch), "--history", str(tmp_path / "h.json")])
+
+    assert sorted(path.name for path in analyzed) == ["A", "B", "kernel"]
+    assert all(path.is_relative_to(scratch) for path in analyzed)
+    assert "broken: failed to prepare: OSError('cannot thin broken')" in capsys.readouterr().out
+    # Staged copies are cleaned up
+    assert not any(scratch.iterdir())
@@ -0,0 +1,43 @@
+import json
+from pathlib import Path
+
+from benchmarks import synthetic_merge
+from output_bundle import MANIFEST_NAME, BundleLoader, write_bundle
+
+
+def shard_files(directory: Path) -> set[str]:
+    return {shard["file"] for shard in json.loads((directory / MANIFEST_NAME).read_text())["shards"]}
+
+
+def test_roundtrip(tmp_path: Path):
+    classes, prototypes = synthetic_merge(200)
+    write_bundle(tmp_path, classes, prototypes, shard_size=16)
+    loader = BundleLoader(tmp_path)
+    assert loader.class_names() == [c.name for c in classes]
+    for clazz in classes[::17]:
+        assert loader.get_class(clazz.name).vtable == clazz.vtable
+
+
+def test_shards_of_a_manifest_are_never_rewritten(tmp_path: Path):
+    first = synthetic_merge(200, seed=1)
+    second = synthetic_merge(200, seed=2)
+    third = synthetic_merge(200, seed=3)
+
+    write_bundle(tmp_path, *first, shard_size=16)
+    first_shards = {name: (tmp_path / name).read_bytes() for name in shard_files(tmp_path)}
+    write_bundle(tmp_path, *second, shard_size=16)
+    # A reader of the previous manifest still finds its shards, unchanged
+    assert {name: (tmp_path / name).read_bytes() for name in first_shards} == first_shards
+
+    second_shards = shard_files(tmp_path)
+    write_bundle(tmp_path, *third, shard_size=16)
+    on_disk = {path.name for path in tmp_path.glob("shard-*.json")}
+    assert on_disk == shard_files(tmp_path) | second_shards
+
+
+def test_unchanged_bundle_keeps_its_shards(tmp_path: Path):
+    classes, prototypes = synthetic_merge(100)
+    write_bundle(tmp_path, classes, prototypes, shard_size=16)
+    before = {path.name: path.stat().st_mtime_ns for path in tmp_path.glob("shard-*.json")}
+    write_bundle(tmp_path, classes, prototypes, shard_size=16)
+    assert {path.name: path.stat().st_mtime_ns for path in tmp_path.glob("shard-*.json")} == before
@@ -0,0 +1,89 @@
+import threading
+import time
+
+import pytest
+from prefetch import Prefetcher
+
+
+class StubPreparer:
+    """Records the prepared and cleaned up items, and how far ahead of the consumer the preparation went"""
+
+    def __init__(self, delay: float = 0.0, failing: frozenset[int] = frozenset()):
+        self.delay = delay
+        self.failing = failing
+        self.lock = threading.Lock()
+        self.started: list[int] = []
+        self.cleaned: list[int] = []
+        self.taken = 0
+        self.max_ahead = 0
+
+    def prepare(self, item: int) -> int:
+        with self.lock:
+            self.started.append(item)
+            self.max_ahead = max(self.max_ahead, len(self.started) - self.taken)
+        time.sleep(self.delay)
+        if item in self.failing:
+            raise OSError(f"cannot prepare {item}")
+        return item
+
+    def cleanup(self, item: int):
+        with self.lock:
+            self.cleaned.append(item)
+
+    def analyze(self, item: int) -> int:
+        with self.lock:
+            self.taken += 1
+        time.sleep(self.delay)
+        return item * 2
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_order_and_cleanup(depth: int):
+    stub = StubPreparer(0.01)
+    results = [stub.analyze(item) for item in Prefetcher(range(10), stub.prepare, stub.cleanup, depth)]
+    assert results == [item * 2 for item in range(10)]
+    assert sorted(stub.cleaned) == list(range(10))
+
+
+@pytest.mark.parametrize("depth", [1, 2, 3])
+def test_depth_bounds_preparation(depth: int):
+    stub = StubPreparer()
+    for item in Prefetcher(range(20), stub.prepare, stub.cleanup, depth, workers=4):
+        stub.analyze(item)
+    # The item being analyzed, and `depth` items ahead of it
+    assert stub.max_ahead <= depth + 1
+
+
+def test_refill_waits_for_next_item():
+    stub = StubPreparer()
+    second_started = threading.Event()
+
+    def prepare(item: int) -> int:
+        if item == 1:
+            # The item after this one must not be prepared until this one is ready
+            assert not second_started.wait(0.2)
+        if item == 2:
+            second_started.set()
+        return stub.prepare(item)
+
+    assert list(Prefetcher(range(3), prepare, depth=1, workers=2)) == [0, 1, 2]
+
+
+def test_early_stop_cleans_up():
+    stub = StubPreparer(0.01)
+    items = iter(Prefetcher(range(10), stub.prepare, stub.cleanup, depth=3))
+    next(items)
+    next(items)
+    items.close()
+    assert sorted(stub.cleaned) == sorted(stub.started)
+    assert len(stub.started) < 10
+
+
+def test_error_raised_at_its_item():
+    stub = StubPreparer(failing=frozenset({2}))
+    consumed = []
+    with pytest.raises(OSError, match="cannot prepare 2"):
+        for item in Prefetcher(range(5), stub.prepare, stub.cleanup, depth=2):
+            consumed.append(item)
+    assert consumed == [0, 1]
+    assert sorted(stub.cleaned) == sorted(set(stub.started) - {2})
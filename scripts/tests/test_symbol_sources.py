@@ -0,0 +1,40 @@
+import json
+from pathlib import Path
+
+from merge_vtable_and_classes import InputMethod
+from symbol_sources import SymbolIndex, SymbolSource
+
+
+def method(name: str, index: int, return_type: str = "IOReturn") -> dict:
+    return {
+        "name": name,
+        "mangled_name": f"__ZN3Foo{len(name)}{name}Ev" if not name.startswith("sub_") else name,
+        "return_type": return_type,
+        "parameters": [{"type": "int", "name": None}],
+        "is_pure_virtual": False,
+        "is_implemented_by_current_class": True,
+        "vtable_index": index,
+    }
+
+
+def write_source(path: Path, vtables: dict[str, list[dict]]) -> SymbolSource:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps(vtables))
+    return SymbolSource(path)
+
+
+def test_provenance_tells_same_named_sources_apart(tmp_path: Path):
+    sources = [
+        write_source(tmp_path / "a" / "methods.json", {"Foo": [method("first", 0), method("sub_10", 1)]}),
+        write_source(tmp_path / "b" / "methods.json", {"Foo": [method("sub_20", 0), method("second", 1)]}),
+        write_source(tmp_path / "b" / "methods2.json", {"Bar": [method("bar", 0)]}),
+    ]
+    index = SymbolIndex.build(sources, frozenset({"Foo", "Bar"}))
+    input_methods = {"Foo": [InputMethod.from_dict(method("sub_30", 0)), InputMethod.from_dict(method("sub_40", 1))]}
+
+    provenance = index.apply(input_methods)
+    assert provenance == {
+        "Foo": {0: str(sources[0].path), 1: str(sources[1].path)},
+        "Bar": {0: str(sources[2].path)},
+    }
+    assert [m.name for m in input_methods["Foo"]] == ["first", "second"]
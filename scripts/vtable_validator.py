@@ -0,0 +1,234 @@
+"""
+Bulk consistency checks of the merge output, to catch merge bugs before they ship.
+
+The output is flattened into integer arrays (vtables concatenated, indexed by per-class offsets) and every invariant is
+checked over all the classes, or all the parent/child pairs, at once:
+- prototype-range: vtable entries point into prototypes.json
+- short-vtable:    a child vtable is at least as long as its parent's
+- prefix:          a child vtable starts with its parent's prototypes
+- vtable-index:    the prototype in slot i has vtable index i, so there are no gaps
+- pure-virtual:    only abstract classes have pure virtual slots
+
+Uses NumPy when available, and plain loops over `array`s otherwise.
+
+Usage: vtable_validator.py [classes.json prototypes.json]
+"""
+
+import sys
+import time
+from array import array
+from collections import Counter
+from dataclasses import dataclass
+
+from merge_vtable_and_classes import CLASSES_OUTPUT, PROTOTYPES_OUTPUT, ClassInfo, MethodPrototype, read_merged_output
+
+try:
+    import numpy as np  # pyright: ignore[reportMissingImports]
+except ModuleNotFoundError:
+    np = None
+
+PROTOTYPE_RANGE = "prototype-range"
+SHORT_VTABLE = "short-vtable"
+PREFIX = "prefix"
+VTABLE_INDEX = "vtable-index"
+PURE_VIRTUAL = "pure-virtual"
+
+# Examples shown per kind of violation
+REPORT_EXAMPLES = 5
+
+DESCRIPTIONS = {
+    PROTOTYPE_RANGE: "prototype {actual}, but there are only {expected}",
+    SHORT_VTABLE: "{actual} slots, but the parent has {expected}",
+    PREFIX: "prototype {actual}, but the parent has {expected}",
+    VTABLE_INDEX: "prototype of vtable index {actual}",
+    PURE_VIRTUAL: "pure virtual in a non-abstract class",
+}
+
+
+@dataclass(frozen=True)
+class Violation:
+    kind: str
+    class_name: str
+    # First offending slot of the class, if the violation is about a slot
+    slot: int | None = None
+    expected: int | None = None
+    actual: int | None = None
+
+    def __str__(self) -> str:
+        location = self.class_name if self.slot is None else f"{self.class_name}[{self.slot}]"
+        return f"{location}: {DESCRIPTIONS[self.kind].format(expected=self.expected, actual=self.actual)}"
+
+
+@dataclass
+class FlatOutput:
+    """The merge output as flat arrays. Classes are rows, their vtable entries are offsets[row]:offsets[row + 1]."""
+
+    names: list[str]
+    parents: array  # row of the parent, or -1
+    is_abstract: array
+    has_vtable: array
+    offsets: array
+    entry_prototypes: array
+    entry_pure_virtual: array
+    prototype_vtable_indices: array
+
+
+def flatten(classes: list[ClassInfo], prototypes: list[MethodPrototype]) -> FlatOutput:
+    rows = {c.name: row for row, c in enumerate(classes)}
+    offsets = array("q", [0])
+    entry_prototypes, entry_pure_virtual = array("q"), array("b")
+    for clazz in classes:
+        for method in clazz.vtable or []:
+            entry_prototypes.append(method.prototype_index)
+            entry_pure_virtual.append(method.is_pure_virtual)
+        offsets.append(len(entry_prototypes))
+
+    return FlatOutput(
+        names=[c.name for c in classes],
+        parents=array("q", [rows.get(c.parent, -1) if c.parent else -1 for c in classes]),
+        is_abstract=array("b", [c.is_abstract for c in classes]),
+        has_vtable=array("b", [c.vtable is not None for c in classes]),
+        offsets=offsets,
+        entry_prototypes=entry_prototypes,
+        entry_pure_virtual=entry_pure_virtual,
+        prototype_vtable_indices=array("q", [p.vtable_index for p in prototypes]),
+    )
+
+
+def validate(flat: FlatOutput) -> list[Violation]:
+    """All the violations, at most one per class and kind (its first slot)"""
+    return _validate_numpy(flat) if np is not None else _validate_arrays(flat)
+
+
+def _validate_arrays(flat: FlatOutput) -> list[Violation]:
+    violations = []
+    for row in range(len(flat.names)):
+        violations.extend(_class_violations(flat, row))
+        violations.extend(_parent_violations(flat, row))
+    return violations
+
+
+def _class_violations(flat: FlatOutput, row: int) -> list[Violation]:
+    name, num_prototypes = flat.names[row], len(flat.prototype_vtable_indices)
+    entries = flat.entry_prototypes[flat.offsets[row] : flat.offsets[row + 1]]
+    violations = []
+
+    out_of_range = next((slot for slot, p in enumerate(entries) if not 0 <= p < num_prototypes), None)
+    if out_of_range is not None:
+        violations.append(Violation(PROTOTYPE_RANGE, name, out_of_range, num_prototypes, entries[out_of_range]))
+    else:
+        indices = [flat.prototype_vtable_indices[p] for p in entries]
+        gap = next((slot for slot, index in enumerate(indices) if index != slot), None)
+        if gap is not None:
+            violations.append(Violation(VTABLE_INDEX, name, gap, gap, indices[gap]))
+
+    if not flat.is_abstract[row]:
+        pure_virtual = flat.entry_pure_virtual[flat.offsets[row] : flat.offsets[row + 1]]
+        slot = next((slot for slot, is_pure_virtual in enumerate(pure_virtual) if is_pure_virtual), None)
+        if slot is not None:
+            violations.append(Violation(PURE_VIRTUAL, name, slot, 0, 1))
+    return violations
+
+
+def _parent_violations(flat: FlatOutput, row: int) -> list[Violation]:
+    parent = flat.parents[row]
+    if parent < 0 or not flat.has_vtable[row] or not flat.has_vtable[parent]:
+        return []
+
+    entries = flat.entry_prototypes[flat.offsets[row] : flat.offsets[row + 1]]
+    parent_entries = flat.entry_prototypes[flat.offsets[parent] : flat.offsets[parent + 1]]
+    if len(entries) < len(parent_entries):
+        return [Violation(SHORT_VTABLE, flat.names[row], None, len(parent_entries), len(entries))]
+    slot = next((slot for slot, p in enumerate(parent_entries) if entries[slot] != p), None)
+    if slot is None:
+        return []
+    return [Violation(PREFIX, flat.names[row], slot, parent_entries[slot], entries[slot])]
+
+
+def _validate_numpy(flat: FlatOutput) -> list[Violation]:
+    assert np is not None
+    parents = np.frombuffer(flat.parents, np.int64)
+    is_abstract = np.frombuffer(flat.is_abstract, np.int8).astype(bool)
+    has_vtable = np.frombuffer(flat.has_vtable, np.int8).astype(bool)
+    offsets = np.frombuffer(flat.offsets, np.int64)
+    entries = np.frombuffer(flat.entry_prototypes, np.int64)
+    pure_virtual = np.frombuffer(flat.entry_pure_virtual, np.int8).astype(bool)
+    vtable_indices = np.frombuffer(flat.prototype_vtable_indices, np.int64)
+
+    lengths = np.diff(offsets)
+    owners = np.repeat(np.arange(len(flat.names)), lengths)
+    slots = np.arange(len(entries)) - offsets[owners]
+    violations: list[Violation] = []
+
+    def first_per_class(kind: str, mask, expected, actual):
+        """Report the first slot of each class where the mask is set"""
+        _, firsts = np.unique(owners[mask], return_index=True)
+        entry_indices = np.flatnonzero(mask)[firsts]
+        for i in entry_indices.tolist():
+            violations.append(Violation(kind, flat.names[owners[i]], int(slots[i]), int(expected[i]), int(actual[i])))
+
+    out_of_range = (entries < 0) | (entries >= len(vtable_indices))
+    first_per_class(PROTOTYPE_RANGE, out_of_range, np.full(len(entries), len(vtable_indices)), entries)
+
+    # Classes with an invalid prototype are not checked further for vtable indices, like in the array version
+    bad_classes = np.zeros(len(flat.names), bool)
+    bad_classes[owners[out_of_range]] = True
+    entry_indices = vtable_indices[np.where(out_of_range, 0, entries)]
+    first_per_class(VTABLE_INDEX, ~bad_classes[owners] & (entry_indices != slots), slots, entry_indices)
+
+    ones = np.ones(len(entries), np.int64)
+    first_per_class(PURE_VIRTUAL, pure_virtual & ~is_abstract[owners], ones - 1, ones)
+
+    # Parent/child pairs with both vtables
+    children = np.flatnonzero((parents >= 0) & has_vtable & has_vtable[np.maximum(parents, 0)])
+    pair_parents = parents[children]
+    parent_lengths = lengths[pair_parents]
+    short = lengths[children] < parent_lengths
+    for child, parent_length in zip(children[short].tolist(), parent_lengths[short].tolist(), strict=True):
+        violations.append(Violation(SHORT_VTABLE, flat.names[child], None, parent_length, int(lengths[child])))
+
+    children, pair_parents, parent_lengths = children[~short], pair_parents[~short], parent_lengths[~short]
+    # One row per slot of every parent vtable: (pair, slot)
+    pairs = np.repeat(np.arange(len(children)), parent_lengths)
+    pair_slots = np.arange(len(pairs)) - np.repeat(np.cumsum(parent_lengths) - parent_lengths, parent_lengths)
+    child_entries = entries[offsets[children][pairs] + pair_slots]
+    parent_entries = entries[offsets[pair_parents][pairs] + pair_slots]
+    _, firsts = np.unique(pairs[child_entries != parent_entries], return_index=True)
+    for i in np.flatnonzero(child_entries != parent_entries)[firsts].tolist():
+        name = flat.names[children[pairs[i]]]
+        violations.append(Violation(PREFIX, name, int(pair_slots[i]), int(parent_entries[i]), int(child_entries[i])))
+    return violations
+
+
+def format_report(violations: list[Violation], num_classes: int) -> list[str]:
+    counts = Counter(v.kind for v in violations)
+    lines = [f"{num_classes} classes checked, {len(violations)} violations"]
+    for kind in (PROTOTYPE_RANGE, SHORT_VTABLE, PREFIX, VTABLE_INDEX, PURE_VIRTUAL):
+        if not counts[kind]:
+            continue
+        examples = sorted((v for v in violations if v.kind == kind), key=lambda v: v.class_name)[:REPORT_EXAMPLES]
+        lines.append(f"{kind}: {counts[kind]} classes")
+        lines.extend(f"    {v}" for v in examples)
+    return lines
+
+
+def main(args):
+    if len(args) not in (0, 2):
+        print("Usage: vtable_validator.py [classes.json prototypes.json]")
+        return
+
+    start = time.perf_counter()
+    classes, prototypes = read_merged_output(*(args or [CLASSES_OUTPUT, PROTOTYPES_OUTPUT]))
+    load_time = time.perf_counter() - start
+    flat = flatten(classes, prototypes)
+    violations, check_time = validate(flat), time.perf_counter() - start - load_time
+
+    for line in format_report(violations, len(classes)):
+        print(line)
+    print(f"Loaded in {load_time:.2f}s, checked in {check_time:.2f}s ({'numpy' if np is not None else 'array'})")
+    if violations:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
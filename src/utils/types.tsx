@@ -4,6 +4,12 @@ export interface Class {
     isAbstract: boolean
     properties?: Record<string, unknown>
     vtable?: VirtualMethod[]
+    /** Pre-order index of the class in the hierarchy. Descendants are [preOrder + 1, subtreeEnd) */
+    preOrder?: number
+    subtreeEnd?: number
+    depth?: number
+    /** Pre-order indices of the ancestors, root first */
+    ancestors?: number[]
 }
 
 export interface VirtualMethod {
@@ -33,6 +39,12 @@ export interface JSONClass {
     isAbstract: boolean
     properties?: Record<string, unknown>
     vtable?: JSONVirtualMethod[]
+    /** Pre-order index of the class in the hierarchy. Descendants are [preOrder + 1, subtreeEnd) */
+    preOrder?: number
+    subtreeEnd?: number
+    depth?: number
+    /** Pre-order indices of the ancestors, root first */
+    ancestors?: number[]
 }
 
 type JSONVirtualMethod = [